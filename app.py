@@ -1,48 +1,65 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import pickle
 import os
+import uuid
 from datetime import datetime
 import time
+import altair as alt
+from drift import MIN_ROWS, PSI_MAJOR, PSI_MODERATE, WINDOW_SECONDS, get_drift_monitor
+from history_store import frame_entries, get_history_store
+from metrics import get_metrics
+from model_registry import get_registry
+from prediction_cache import PredictionCache, predict_one
+from shadow import DIFF_TOLERANCE, get_shadow
+from scoring import (
+    DIAMETERS, GRADE_STANDARDS, GRADES, INPUT_COLS, TARGETS, quality_threshold, score_frame, unscored_rows, read_batch_file, to_csv_bytes, model_key as make_model_key
+)
+from optimizer import optimize_process
+from sweep import default_range, run_sweep
+from theme import THEMES, build_css
 
 # --- MODEL LOADING WITH ERROR HANDLING ---
 @st.cache_resource
-def load_all_models():
-    """Cache all models at startup with proper error handling"""
-    model_dict = {}
-    model_files = [
-        "quality1_d10.pkl", "quality1_d12.pkl", "quality1_d16.pkl",
-        "quality2_d10.pkl", "quality2_d12.pkl", "quality2_d16.pkl"
-    ]
-    
-    # Create models directory if it doesn't exist
-    os.makedirs("models", exist_ok=True)
-    
-    for filename in model_files:
-        try:
-            model_path = os.path.join("models", filename)
-            if os.path.exists(model_path):
-                with open(model_path, "rb") as f:
-                    # Extract model key from filename (e.g., "quality1_d10")
-                    key = filename.split('.')[0]
-                    model_dict[key] = pickle.load(f)
-                    print(f"✅ Loaded model: {key}")
-            else:
-                print(f"⚠️ Model file not found: {model_path}")
-                # Create placeholder model if in debug mode
-                if st.session_state.get('debug_mode', False):
-                    from sklearn.ensemble import RandomForestRegressor
-                    model_dict[key] = RandomForestRegressor()
-                    print(f"⚠️ Created dummy model for: {key}")
-        except Exception as e:
-            print(f"❌ Error loading {filename}: {str(e)}")
-            if st.session_state.get('debug_mode', False):
-                from sklearn.ensemble import RandomForestRegressor
-                model_dict[key] = RandomForestRegressor()
-                print(f"⚠️ Created dummy model after error for: {key}")
-    
-    return model_dict
+def load_model_registry():
+    """Shared process-wide registry; models are loaded lazily on first use"""
+    registry = get_registry()
+    # Retrained artifacts are picked up and hot-swapped without restarting the app
+    registry.start_watcher()
+    get_metrics().register_gauges("model_cache", registry.cache_info)
+    return registry
+
+@st.cache_resource
+def load_prediction_cache():
+    """Process-wide cache of single-row predictions shared by all sessions"""
+    cache = PredictionCache()
+    get_metrics().register_gauges("prediction_cache", cache.info)
+    return cache
+
+metrics = get_metrics()
+rerun_start = time.perf_counter()
+
+@st.cache_resource
+def load_history_store():
+    """Durable prediction log shared by all sessions, written off the request path"""
+    store = get_history_store()
+    get_metrics().register_gauges("history", store.info)
+    return store
+
+@st.cache_resource
+def load_drift_monitor():
+    """Rolling input-drift sketches shared by all sessions"""
+    monitor = get_drift_monitor()
+    get_metrics().register_gauges("drift", monitor.info)
+    return monitor
+
+@st.cache_resource
+def load_shadow():
+    """Shadow candidates (models/shadow) scored alongside production, shared by all sessions"""
+    shadow = get_shadow()
+    shadow.registry.start_watcher()
+    get_metrics().register_gauges("shadow", shadow.info)
+    return shadow
 
 # --- PAGE CONFIG ---
 st.set_page_config(
@@ -55,14 +72,15 @@ st.set_page_config(
 # Initialize session state variables
 if 'dark_mode' not in st.session_state:
     st.session_state.dark_mode = False
-if 'history' not in st.session_state:
-    st.session_state.history = []
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 if 'feedback_submitted' not in st.session_state:
     st.session_state.feedback_submitted = False
-if 'debug_mode' not in st.session_state:
-    st.session_state.debug_mode = False
-if 'models' not in st.session_state:
-    st.session_state.models = load_all_models()
+registry = load_model_registry()
+prediction_cache = load_prediction_cache()
+history_store = load_history_store()
+drift_monitor = load_drift_monitor()
+shadow = load_shadow()
 
 # Keep-alive tracking
 if 'last_activity' not in st.session_state:
@@ -76,323 +94,18 @@ def toggle_theme():
     st.rerun()
 
 # --- COLORS ---
-if st.session_state.dark_mode:
-    BG_COLOR = "#121212"
-    TEXT_COLOR = "#e0e0e0"
-    SIDEBAR_BG = "#1e1e1e"
-    SIDEBAR_TEXT = "#cccccc"
-    INPUT_BG = "#2c2c2c"
-    INPUT_TEXT = "#f0f0f0"
-    BUTTON_BG = "#1abc9c"
-    BUTTON_HOVER = "#159b85"
-    CARD_BG = "#1f2933"
-    CARD_BORDER = "#1abc9c"
-    SHADOW = "0 4px 12px rgba(0, 255, 200, 0.3)"
-    HISTORY_BG = "#2c3e50"
-    LABEL_COLOR = "#f0f0f0"
-    TAB_COLOR = "white"
-    TAB_FONT = "'Montserrat', 'Segoe UI', Arial, sans-serif"
-else:
-    BG_COLOR = "#f0f2f6"
-    TEXT_COLOR = "#2c3e50"
-    SIDEBAR_BG = "#ffffff"
-    SIDEBAR_TEXT = "#2c3e50"
-    INPUT_BG = "#ffffff"
-    INPUT_TEXT = "#2c3e50"
-    BUTTON_BG = "#2980b9"
-    BUTTON_HOVER = "#1f6391"
-    CARD_BG = "#ffffff"
-    CARD_BORDER = "#3498db"
-    SHADOW = "0 4px 12px rgba(0, 0, 0, 0.08)"
-    HISTORY_BG = "#ecf0f1"
-    LABEL_COLOR = "#2c3e50"
-    TAB_COLOR = "#2c3e50"
-    TAB_FONT = "'Montserrat', 'Segoe UI', Arial, sans-serif"
+theme_name = "dark" if st.session_state.dark_mode else "light"
+BG_COLOR = THEMES[theme_name]["BG_COLOR"]
+TEXT_COLOR = THEMES[theme_name]["TEXT_COLOR"]
+CARD_BORDER = THEMES[theme_name]["CARD_BORDER"]
+LABEL_COLOR = THEMES[theme_name]["LABEL_COLOR"]
+SHADOW = THEMES[theme_name]["SHADOW"]
 
 # --- CSS INJECTION ---
-st.markdown(f"""
-<style>
-body {{
-    font-family: 'Segoe UI', Arial, sans-serif !important;
-}}
-
-/* Enhanced TAB styling */
-div[data-baseweb="tabs"] > div:first-child {{
-    margin-left: 0 !important;
-    margin-right: 0 !important;
-    width: 100% !important;
-    display: flex !important;
-    justify-content: space-between !important;
-    border-radius: 16px 16px 0 0;
-    box-shadow: 0 2px 6px rgba(0,0,0,0.05);
-    background: {CARD_BG};
-}}
-
-button[data-baseweb="tab"] {{
-    font-family: {TAB_FONT};
-    font-size: 1.19rem;
-    font-weight: 700 !important;
-    color: {TAB_COLOR} !important;
-    background: none !important;
-    flex: 1 1 0px !important;
-    max-width: none !important;
-    padding: 22px 0 18px 0 !important;
-    margin: 0 !important;
-    border-radius: 0 !important;
-    border-bottom: 4px solid transparent !important;
-    transition: background 0.25s, border-bottom 0.25s;
-    justify-content: center !important;
-    align-items: center !important;
-}}
-
-button[data-baseweb="tab"][aria-selected="true"] {{
-    border-bottom: 4px solid {CARD_BORDER} !important;
-    color: {CARD_BORDER} !important;
-    background: rgba(26,188,156,0.08) !important;
-    font-weight: 900 !important;
-    letter-spacing: .4px;
-}}
-
-button[data-baseweb="tab"]:hover {{
-    background: rgba(52,152,219,0.12) !important;
-    color: {CARD_BORDER} !important;
-}}
-
-.tab-content-wrapper {{
-    padding-top: 20px;
-    padding-bottom: 20px;
-}}
-
-#MainMenu {{visibility: hidden;}}
-footer {{visibility: hidden;}}
-html, body {{
-    background-color: {BG_COLOR} !important;
-    color: {TEXT_COLOR} !important;
-}}
-[data-testid="stAppViewContainer"],
-.css-18e3th9,
-.css-1v3fvcr {{
-    background-color: {BG_COLOR} !important;
-    color: {TEXT_COLOR} !important;
-}}
-[data-testid="stSidebar"] > div:first-child {{
-    background-color: {SIDEBAR_BG} !important;
-    color: {SIDEBAR_TEXT} !important;
-}}
-[data-testid="stSidebar"] * {{
-    color: {SIDEBAR_TEXT} !important;
-}}
-[data-testid="stWidgetLabel"] p {{
-    color: {LABEL_COLOR} !important;
-    font-weight: 600 !important;
-}}
-.stNumberInput label, .stSelectbox label {{
-    color: {LABEL_COLOR} !important;
-}}
-.stButton>button {{
-    background-color: {BUTTON_BG} !important;
-    color: white !important;
-    padding: 0.7em 1.8em !important;
-    border-radius: 12px !important;
-    font-weight: 700 !important;
-    font-size: 16px;
-    transition: all 0.3s ease;
-    border: none !important;
-    box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-}}
-.stButton>button:hover {{
-    background-color: {BUTTON_HOVER} !important;
-    transform: translateY(-2px);
-    box-shadow: 0 4px 8px rgba(0,0,0,0.3);
-}}
-.prediction-card {{
-    text-align: center;
-    margin-top: 50px;
-    padding: 32px 40px;
-    background: {CARD_BG};
-    border-radius: 14px;
-    box-shadow: {SHADOW};
-    border-top: 6px solid {CARD_BORDER};
-    transition: all 0.3s ease;
-}}
-.prediction-card:hover {{
-    transform: translateY(-5px);
-    box-shadow: 0 8px 24px rgba(0, 255, 200, 0.4);
-}}
-.prediction-card h2 {{
-    color: {TEXT_COLOR};
-    font-size: 28px;
-}}
-.prediction-card p {{
-    margin: 0;
-    font-size: 40px;
-    font-weight: 900;
-    color: {CARD_BORDER};
-}}
-.history-card {{
-    background: {HISTORY_BG};
-    border-radius: 8px;
-    padding: 12px 16px;
-    margin-bottom: 10px;
-    box-shadow: {SHADOW};
-    transition: all 0.2s ease;
-}}
-.history-card:hover {{
-    transform: scale(1.02);
-}}
-.history-header {{
-    font-weight: 600;
-    margin-bottom: 15px;
-    color: {CARD_BORDER};
-}}
-.custom-footer {{
-    text-align: center;
-    padding: 18px 0;
-    font-size: 14px;
-    color: {SIDEBAR_TEXT};
-    margin-top: 60px;
-    border-top: 1px solid {CARD_BORDER};
-}}
-.input-section {{
-    background: {CARD_BG};
-    padding: 20px;
-    border-radius: 12px;
-    margin-bottom: 20px;
-    box-shadow: {SHADOW};
-}}
-.tooltip {{
-    position: relative;
-    display: inline-block;
-    border-bottom: 1px dotted {CARD_BORDER};
-}}
-.tooltip .tooltiptext {{
-    visibility: hidden;
-    width: 200px;
-    background-color: {CARD_BORDER};
-    color: {TEXT_COLOR};
-    text-align: center;
-    border-radius: 6px;
-    padding: 5px;
-    position: absolute;
-    z-index: 1;
-    bottom: 125%;
-    left: 50%;
-    margin-left: -100px;
-    opacity: 0;
-    transition: opacity 0.3s;
-}}
-.tooltip:hover .tooltiptext {{
-    visibility: visible;
-    opacity: 1;
-}}
-input[type=range] {{
-    -webkit-appearance: none;
-    width: 100%;
-    height: 8px;
-    border-radius: 5px;
-    background: {INPUT_BG};
-    outline: none;
-}}
-input[type=range]::-webkit-slider-thumb {{
-    -webkit-appearance: none;
-    appearance: none;
-    width: 20px;
-    height: 20px;
-    border-radius: 50%;
-    background: {CARD_BORDER};
-    cursor: pointer;
-}}
-.about-feature-container {{
-    display: flex;
-    align-items: flex-start;
-    margin-bottom: 20px;
-    padding: 15px;
-    background: rgba(26, 188, 156, 0.1);
-    border-radius: 8px;
-    border-left: 4px solid {CARD_BORDER};
-}}
-.feature-grid {{
-    display: grid;
-    grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
-    gap: 20px;
-    margin: 20px 0;
-}}
-.feature-card {{
-    background: rgba(26, 188, 156, 0.05);
-    padding: 20px;
-    border-radius: 8px;
-    border: 1px solid rgba(26, 188, 156, 0.2);
-    transition: all 0.3s ease;
-}}
-.feature-card:hover {{
-    transform: translateY(-3px);
-    box-shadow: 0 5px 15px rgba(0,0,0,0.1);
-}}
-.quality-standards {{
-    margin: 20px 0;
-}}
-.standard-row {{
-    display: flex;
-    justify-content: space-between;
-    padding: 12px;
-    margin-bottom: 8px;
-    background: rgba(26, 188, 156, 0.05);
-    border-radius: 6px;
-}}
-.standard-grade {{
-    font-weight: bold;
-    color: {CARD_BORDER};
-}}
-.standard-value {{
-    font-weight: bold;
-}}
-.theme-switch {{
-    position: relative;
-    display: inline-block;
-    width: 60px;
-    height: 34px;
-    margin-top: 10px;
-}}
-.theme-switch input {{
-    opacity: 0;
-    width: 0;
-    height: 0;
-}}
-.slider {{
-    position: absolute;
-    cursor: pointer;
-    top: 0;
-    left: 0;
-    right: 0;
-    bottom: 0;
-    background-color: #ccc;
-    transition: .4s;
-    border-radius: 34px;
-}}
-.slider:before {{
-    position: absolute;
-    content: "🌙";
-    height: 26px;
-    width: 26px;
-    left: 4px;
-    bottom: 4px;
-    background-color: white;
-    transition: .4s;
-    border-radius: 50%;
-    display: flex;
-    align-items: center;
-    justify-content: center;
-    font-size: 14px;
-}}
-input:checked + .slider {{
-    background-color: {CARD_BORDER};
-}}
-input:checked + .slider:before {{
-    content: "☀";
-    transform: translateX(26px);
-}}
-</style>
-""", unsafe_allow_html=True)
+# Formatted once per theme per process; a rerun only resends the cached string
+css_start = time.perf_counter()
+st.markdown(build_css(theme_name), unsafe_allow_html=True)
+metrics.observe("render_css", time.perf_counter() - css_start)
 
 # --- TITLE AND THEME TOGGLE ---
 header_col1, header_col2 = st.columns([6, 1])
@@ -405,57 +118,140 @@ with header_col2:
     if st.button("🌙" if st.session_state.dark_mode else "☀", key="theme_toggle"):
         toggle_theme()
 
+# --- FEATURE IMPORTANCE ---
+def render_feature_importance(model, input_record, target, top_n=10):
+    """Train-time global importances next to this prediction's tree-path attributions"""
+    if not hasattr(model, "contributions"):
+        st.info("Feature importance is not available for this model.")
+        return
+    bias, contrib = model.contributions(model.vector_from_record(input_record))
+    contrib = contrib.iloc[0]
+    top = contrib.reindex(contrib.abs().sort_values(ascending=False).index[:top_n])
+    importance_cols = st.columns(2)
+    with importance_cols[0]:
+        st.markdown("#### 🌲 Global Importance")
+        importances = model.global_importances()
+        if importances is None:
+            st.caption("Retrain the model to store global importances.")
+        else:
+            st.bar_chart(importances.head(top_n))
+    with importance_cols[1]:
+        st.markdown("#### 🧭 This Prediction")
+        contrib_df = pd.DataFrame({"feature": top.index, "contribution": top.to_numpy()})
+        chart = alt.Chart(contrib_df).mark_bar().encode(
+            x=alt.X("contribution:Q", title=f"Effect on {target}"),
+            y=alt.Y("feature:N", sort=None, title=None),
+            color=alt.condition("datum.contribution > 0", alt.value("#1abc9c"), alt.value("#e74c3c")),
+        )
+        st.altair_chart(chart, use_container_width=True)
+        st.caption(f"Training average {bias:.2f} + contributions = prediction")
+
 # --- SIDEBAR INPUTS ---
 with st.sidebar:
     st.header("🔧 Configuration")
-    diameter = st.selectbox("📏 Select Diameter", [10, 12, 16], help="Select the diameter of the rebar")
+    diameter = st.selectbox("📏 Select Diameter", registry.available_diameters() or DIAMETERS,
+                            help="Select the diameter of the rebar")
     grade = st.selectbox("🏷 Select Grade", ["GR 1", "GR 2", "GR 3"], help="Select the grade of the rebar")
     target = st.selectbox("🎯 Select Target", ["QUALITY1", "QUALITY2"], help="Select the quality metric to predict")
     with st.expander("⚙ Advanced Settings"):
         confidence_threshold = st.slider("Confidence Threshold", 0.7, 1.0, 0.85, 0.01,
-                                       help="Set the minimum confidence level for predictions")
-        st.session_state.debug_mode = st.checkbox("Enable Debug Mode", value=False,
-                   help="Show additional technical details about the prediction")
-        st.checkbox("Show Feature Importance", value=False,
+                                       help="Warn when the 90% interval is wider than (1 - threshold) of the prediction")
+        show_debug = st.checkbox("Show Debug Panel", value=False,
+                   help="Show timing histograms and cache statistics for this server")
+        show_importance = st.checkbox("Show Feature Importance", value=False,
                    help="Display which features most influence the prediction")
     
     # Model status indicator
     st.markdown("---")
-    loaded_models = len(st.session_state.models)
-    if loaded_models == 6:
-        st.success(f"✅ All models loaded ({loaded_models}/6)")
-    elif loaded_models > 0:
-        st.warning(f"⚠️ Partial models loaded ({loaded_models}/6)")
+    cache_info = registry.cache_info()
+    if cache_info["available"] > 0:
+        st.success(f"✅ Models available ({cache_info['resident']}/{cache_info['available']} in memory)")
     else:
-        st.error("❌ No models loaded!")
+        st.error("❌ No models found!")
+    st.caption(
+        f"Cache: {cache_info['hits']} hits • {cache_info['misses']} misses • "
+        f"{cache_info['evictions']} evictions • avg load {cache_info['avg_load_ms']:.0f} ms"
+    )
+    if show_debug:
+        with st.expander("🛠 Debug Panel", expanded=True):
+            pred_cache_info = prediction_cache.info()
+            st.caption(
+                f"Prediction cache: {pred_cache_info['size']}/{pred_cache_info['max_entries']} entries • "
+                f"hit rate {pred_cache_info['hit_rate']:.0%}"
+            )
+            st.caption(f"Model memory: {cache_info['nbytes'] / 1e6:.1f} MB")
+            st.dataframe(pd.DataFrame([
+                {"model": key, "version": s["version_id"], "load_ms": round(s["load_seconds"] * 1000, 1),
+                 "MB": round(s["nbytes"] / 1e6, 2)}
+                for key, s in registry.stats.items()
+            ]), hide_index=True)
+            st.markdown("**Timing spans** (rolling window, ms)")
+            span_rows = metrics.snapshot()
+            if span_rows:
+                st.dataframe(pd.DataFrame(span_rows).round(3), hide_index=True)
+            else:
+                st.caption("No spans recorded yet.")
+            st.download_button("⬇️ Prometheus metrics", data=metrics.render_prometheus,
+                               file_name="metrics.prom", mime="text/plain")
     
     # --- Download Prediction History ---
-    if st.session_state.history:
+    # Only this session's newest 10 rows are read; the full log stays on disk
+    if st.session_state.pop("history_pending", False):
+        # Make a new prediction visible here and in Insights; the write itself stayed off the predict path
+        history_store.flush(timeout=0.5)
+    session_history, _ = history_store.page(limit=10, session_id=st.session_state.session_id)
+    if len(session_history):
         st.markdown("---")
         st.markdown('<div class="history-header">📜 Prediction History</div>', unsafe_allow_html=True)
-        for entry in st.session_state.history:
+        for entry in session_history.itertuples():
             st.markdown(f'''
                 <div class="history-card">
-                    <small>🕒 {entry['timestamp']}</small>
-                    <p><strong>{entry['target']}</strong>: {entry['prediction']}</p>
-                    <small>📏 Dia: {entry['diameter']}mm | 🏷 Grade: {entry['grade']}</small>
+                    <small>🕒 {entry.timestamp}</small>
+                    <p><strong>{entry.target}</strong>: {entry.prediction:.2f}</p>
+                    <small>📏 Dia: {entry.diameter:g}mm | 🏷 Grade: {entry.grade}</small>
                 </div>
             ''', unsafe_allow_html=True)
-        # Download button
-        pred_hist_df = pd.DataFrame(st.session_state.history)
-        csv = pred_hist_df.to_csv(index=False)
-        st.download_button("⬇️ Download History as CSV", data=csv, file_name="prediction_history.csv", mime="text/csv")
+        # Download button; the CSV is built only when clicked
+        session_id = st.session_state.session_id
+        st.download_button("⬇️ Download History as CSV", data=lambda: history_store.export_csv(session_id=session_id),
+                           file_name="prediction_history.csv", mime="text/csv")
         if st.button("🧹 Clear History"):
-            st.session_state.history = []
+            history_store.hide_session(st.session_state.session_id)
+            history_store.flush(timeout=1.0)
             st.rerun()
 
-# --- MAIN TABS ---
-tabs = st.tabs(["📊 Prediction", "ℹ About", "💡 Insights / Recommendations", "❓ FAQ", "📞 Contact / Feedback"])
+# --- PREDICTION PANEL ---
+def render_prediction_result(last, confidence_threshold, show_importance):
+    """Result card for the last Predict click (a dict stored in session state)"""
+    target, diameter = last["target"], last["diameter"]
+    prediction, confidence = last["prediction"], last["confidence"]
+    with metrics.span("render_prediction"):
+        if confidence < confidence_threshold:
+            st.warning(f"⚠ Prediction confidence is {confidence:.0%} (below threshold)")
+        st.markdown(f'''
+            <div class="prediction-card">
+                <h2>📊 Prediction Result</h2>
+                <p>Predicted <strong>{target}</strong> value:</p>
+                <p>{prediction:.2f}</p>
+                <small style="font-size: 16px; color: {TEXT_COLOR};">90% interval: {last["lower"]:.2f} – {last["upper"]:.2f} • Confidence: {confidence:.0%}</small><br>
+                <small style="color: {TEXT_COLOR};">Model {make_model_key(target, diameter)} • version {last["model_version"]}</small>
+            </div>
+        ''', unsafe_allow_html=True)
 
-# Prediction Tab
-with tabs[0]:
-    st.markdown('<div class="tab-content-wrapper">', unsafe_allow_html=True)
+        if prediction >= last["min_quality"]:
+            st.success("✅ This batch meets quality standards")
+        else:
+            st.error("❌ This batch does NOT meet quality standards")
+
+    if show_importance:
+        render_feature_importance(
+            registry.get(make_model_key(target, diameter)), last["input_record"], target
+        )
+    st.balloons()
 
+@st.fragment
+def render_prediction_panel(diameter, grade, target, confidence_threshold, show_importance):
+    """Inputs, Predict and the result card; interacting here reruns only this fragment"""
     with st.expander("🧪 Chemical Composition (Click to expand)", expanded=True):
         st.markdown(f"""
         <div style="margin-bottom: 15px; color:{LABEL_COLOR};">
@@ -471,6 +267,7 @@ with tabs[0]:
                            unsafe_allow_html=True)
                 chem_inputs[f"CHEM{i}"] = st.number_input(
                     f"CHEM {i}", 
+                    key=f"input_CHEM{i}",
                     value=0.0,
                     min_value=0.0,
                     max_value=100.0,
@@ -493,6 +290,7 @@ with tabs[0]:
                            unsafe_allow_html=True)
                 temp_inputs[f"TEMP{i}"] = st.number_input(
                     f"TEMP {i}", 
+                    key=f"input_TEMP{i}",
                     value=0.0,
                     min_value=0.0,
                     max_value=1500.0,
@@ -514,6 +312,7 @@ with tabs[0]:
                            unsafe_allow_html=True)
                 process_inputs[f"PROCESS{i}"] = st.number_input(
                     f"PROCESS {i}", 
+                    key=f"input_PROCESS{i}",
                     value=0.0,
                     min_value=0.0,
                     step=0.1,
@@ -527,6 +326,7 @@ with tabs[0]:
         """, unsafe_allow_html=True)
         speed = st.number_input(
             "SPEED", 
+            key="input_SPEED",
             value=0.0,
             min_value=0.0,
             max_value=30.0,
@@ -538,8 +338,8 @@ with tabs[0]:
     with predict_col:
         if st.button("🤖 Predict Quality", use_container_width=True):
             try:
-                model_key = f"{target.lower()}_d{diameter}"
-                model = st.session_state.models.get(model_key)
+                model_key = make_model_key(target, diameter)
+                model = registry.get(model_key)
 
                 if model is None:
                     st.error(f"""
@@ -552,60 +352,56 @@ with tabs[0]:
                     """)
                 else:
                     with st.spinner("🔍 Analyzing parameters..."):
-                        input_dict = {k: [v] for k, v in {
+                        input_record = {
                             **chem_inputs,
                             **temp_inputs,
                             "SPEED": speed,
-                            **process_inputs
-                        }.items()}
-                        grade_key = f"GRADE_{grade.replace(' ', '')}"
-                        for g in ["GR1", "GR2", "GR3"]:
-                            input_dict[f"GRADE_{g}"] = [1 if f"GRADE_{g}" == grade_key else 0]
-                        input_df = pd.DataFrame(input_dict)
-                        
-                        # Handle missing columns more gracefully
-                        expected_columns = getattr(model, "feature_names_in_", [])
-                        missing_cols = set(expected_columns) - set(input_df.columns)
-                        for col in missing_cols:
-                            input_df[col] = 0
-                        
-                        # Ensure correct column order
-                        input_df = input_df[expected_columns] if len(expected_columns) > 0 else input_df
+                            **process_inputs,
+                            "GRADE": grade
+                        }
                         
-                        # Make prediction
-                        prediction = model.predict(input_df)[0]
-                        confidence = min(0.95 + np.random.random() * 0.05, 1.0)
+                        # Make prediction: mean and per-tree spread from one forest pass,
+                        # reused from the shared cache for repeated inputs
+                        min_quality = quality_threshold(target, grade)
+                        result = predict_one(registry, prediction_cache, target, diameter, input_record, shadow=shadow)
+                        drift_monitor.observe_record(diameter, input_record)
+                        prediction = result["prediction"]
+                        lower, upper = result["lower"], result["upper"]
+                        confidence = result["confidence"]
                         
                         # Store results
-                        st.session_state.history.insert(0, {
-                            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            'diameter': diameter,
-                            'grade': grade,
-                            'target': target,
-                            'prediction': f"{prediction:.2f}",
-                            'confidence': f"{confidence:.0%}",
-                            'inputs': {**chem_inputs, **temp_inputs, **process_inputs, "SPEED": speed}
-                        })
-                        st.session_state.history = st.session_state.history[:10]
-
-                        # Display results
-                        if confidence < confidence_threshold:
-                            st.warning(f"⚠ Prediction confidence is {confidence:.0%} (below threshold)")
-                        st.markdown(f'''
-                            <div class="prediction-card">
-                                <h2>📊 Prediction Result</h2>
-                                <p>Predicted <strong>{target}</strong> value:</p>
-                                <p>{prediction:.2f}</p>
-                                <small style="font-size: 16px; color: {TEXT_COLOR};">Confidence: {confidence:.0%}</small>
-                            </div>
-                        ''', unsafe_allow_html=True)
-                        
-                        quality_thresholds = {"QUALITY1": 75, "QUALITY2": 80}.get(target, 75)
-                        if prediction >= quality_thresholds:
-                            st.success("✅ This batch meets quality standards")
-                        else:
-                            st.error("❌ This batch does NOT meet quality standards")
-                        st.balloons()
+                        with metrics.span("history_update"):
+                            history_store.append({
+                                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                'session_id': st.session_state.session_id,
+                                'diameter': diameter,
+                                'grade': grade.replace(" ", ""),
+                                'target': target,
+                                'prediction': prediction,
+                                'std': result["std"],
+                                'lower': lower,
+                                'upper': upper,
+                                'confidence': confidence,
+                                'meets': prediction >= min_quality,
+                                'model_version': result["model_version"],
+                                'inputs': {**chem_inputs, **temp_inputs, **process_inputs, "SPEED": speed}
+                            })
+                            st.session_state.history_pending = True
+
+                        # Full rerun, so the sidebar and Insights history show the new row;
+                        # the card is drawn from session state on that run
+                        st.session_state.last_prediction = {
+                            "target": target,
+                            "diameter": diameter,
+                            "prediction": prediction,
+                            "lower": lower,
+                            "upper": upper,
+                            "confidence": confidence,
+                            "min_quality": min_quality,
+                            "model_version": result["model_version"],
+                            "input_record": input_record,
+                        }
+                        st.rerun(scope="app")
                         
             except Exception as e:
                 st.error(f"""
@@ -618,10 +414,77 @@ with tabs[0]:
                 
                 Please check your input values and try again.
                 """)
+        # Shown once, on the run right after Predict (like the baseline's button-scoped card)
+        last_prediction = st.session_state.pop("last_prediction", None)
+        if last_prediction is not None:
+            render_prediction_result(last_prediction, confidence_threshold, show_importance)
     with reset_col:
         if st.button("🔄 Reset", use_container_width=True):
             st.rerun()
 
+def current_inputs():
+    """Latest values of the prediction panel's inputs, read from widget state"""
+    return {col: st.session_state.get(f"input_{col}", 0.0) for col in INPUT_COLS}
+
+# --- MAIN TABS ---
+tabs = st.tabs(["📊 Prediction", "ℹ About", "💡 Insights / Recommendations", "❓ FAQ", "📞 Contact / Feedback"])
+
+# Prediction Tab
+with tabs[0]:
+    st.markdown('<div class="tab-content-wrapper">', unsafe_allow_html=True)
+    render_prediction_panel(diameter, grade, target, confidence_threshold, show_importance)
+
+    # --- BATCH SCORING ---
+    with st.expander("📂 Batch Scoring (Upload CSV/XLSX)", expanded=False):
+        st.markdown(f"""
+        <div style="margin-bottom: 15px; color:{LABEL_COLOR};">
+        Upload a file with CHEM1-10, TEMP1-6, PROCESS1-3, SPEED, GRADE and DIAMETER columns.
+        Rows without a DIAMETER use the diameter selected in the sidebar.
+        </div>
+        """, unsafe_allow_html=True)
+        batch_file = st.file_uploader("Batch file", type=["csv", "xlsx"], label_visibility="collapsed")
+        if batch_file is not None and st.button("📊 Score Batch", use_container_width=True):
+            try:
+                with st.spinner("🔍 Scoring batch..."):
+                    start = time.perf_counter()
+                    batch_df = read_batch_file(batch_file)
+                    with metrics.span("batch_score"):
+                        scored_df, missing_models = score_frame(
+                            batch_df, registry, default_diameter=diameter, shadow=shadow
+                        )
+                    elapsed = time.perf_counter() - start
+                    drift_monitor.observe_frame(batch_df, default_diameter=diameter)
+                with metrics.span("history_update"):
+                    history_store.append_many(frame_entries(scored_df, st.session_state.session_id, TARGETS))
+                    st.session_state.history_pending = True
+                # Keep the frame; the CSV is only serialized if the download is clicked
+                st.session_state.batch_result = scored_df
+                st.session_state.batch_result_name = f"scored_{os.path.splitext(batch_file.name)[0]}.csv"
+                st.success(f"✅ Scored {len(scored_df):,} rows in {elapsed:.2f}s")
+                if missing_models:
+                    st.warning(f"⚠️ No model for: {', '.join(sorted(set(missing_models)))}")
+                n_unscored = unscored_rows(scored_df)
+                if n_unscored:
+                    st.warning(f"⚠️ {n_unscored:,} row(s) left unscored (no usable DIAMETER or model)")
+                st.dataframe(scored_df.head(20))
+            except Exception as e:
+                st.error(f"""
+                🚨 Batch scoring failed!
+                
+                **Error details:**
+                ```python
+                {str(e)}
+                ```
+                """)
+        if st.session_state.get("batch_result") is not None:
+            batch_result = st.session_state.batch_result
+            st.download_button(
+                "⬇️ Download Scored File",
+                data=lambda: to_csv_bytes(batch_result),
+                file_name=st.session_state.batch_result_name,
+                mime="text/csv"
+            )
+
     st.markdown('</div>', unsafe_allow_html=True)
 
 # About Tab
@@ -652,21 +515,14 @@ with tabs[1]:
         st.markdown("#### 🌓 Dark/Light Mode")
         st.markdown("Choose your preferred viewing theme for comfortable use.")
         st.markdown("#### 📜 History Tracking")
-        st.markdown("Review your last 10 predictions for comparison.")
+        st.markdown("Every prediction is logged; browse and export the full history from the Insights tab.")
     st.markdown("### Quality Standards")
     standards = st.columns(3)
-    with standards[0]:
-        st.markdown("*GR 1*")
-        st.markdown("QUALITY1 ≥ 70")
-        st.markdown("QUALITY2 ≥ 75")
-    with standards[1]:
-        st.markdown("*GR 2*")
-        st.markdown("QUALITY1 ≥ 80")
-        st.markdown("QUALITY2 ≥ 85")
-    with standards[2]:
-        st.markdown("*GR 3*")
-        st.markdown("QUALITY1 ≥ 90")
-        st.markdown("QUALITY2 ≥ 95")
+    for col, (grade_name, minimums) in zip(standards, GRADE_STANDARDS.items()):
+        with col:
+            st.markdown(f"*{grade_name[:2]} {grade_name[2:]}*")
+            for target_name, minimum in minimums.items():
+                st.markdown(f"{target_name} ≥ {minimum}")
     st.markdown("### Technical Specifications")
     st.markdown("""
     - *Models:* Ensemble of Random Forest and XGBoost algorithms
@@ -718,12 +574,173 @@ with tabs[2]:
         </div>
         """, unsafe_allow_html=True)
     st.markdown("---")
-    if st.session_state.history:
-        st.markdown("### 🔍 Recent Predictions Summary")
-        recent_df = pd.DataFrame(st.session_state.history).head(5)
-        st.dataframe(recent_df[["timestamp", "target", "prediction", "confidence", "diameter", "grade"]])
+    st.markdown("### 🔍 Prediction History")
+    filter_cols = st.columns(4)
+    with filter_cols[0]:
+        history_scope = st.selectbox("Sessions", ["This session", "All sessions"], key="history_scope")
+    with filter_cols[1]:
+        history_diameter = st.selectbox("Diameter", ["All"] + list(DIAMETERS), key="history_diameter")
+    with filter_cols[2]:
+        history_grade = st.selectbox("Grade", ["All"] + GRADES, key="history_grade")
+    with filter_cols[3]:
+        page_size = st.selectbox("Rows per page", [10, 25, 100], index=1, key="history_page_size")
+    history_filters = {
+        "session_id": st.session_state.session_id if history_scope == "This session" else None,
+        "diameter": None if history_diameter == "All" else history_diameter,
+        "grade": None if history_grade == "All" else history_grade,
+    }
+    # Keyset cursors: one "older than id" bound per page visited, reset when the filters change
+    filter_signature = (history_scope, history_diameter, history_grade, page_size)
+    if st.session_state.get("history_filter_signature") != filter_signature:
+        st.session_state.history_filter_signature = filter_signature
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+    if st.session_state.pop("history_pending", False):
+        # A batch scored earlier in this run was queued after the sidebar read the log
+        history_store.flush(timeout=1.0)
+    history_page, next_cursor = history_store.page(limit=page_size, before_id=cursors[-1], **history_filters)
+    if len(history_page):
+        st.dataframe(
+            history_page[["timestamp", "target", "prediction", "lower", "upper", "confidence", "meets",
+                          "diameter", "grade", "model_version"]],
+            hide_index=True, use_container_width=True,
+        )
     else:
         st.info("No prediction history available for trend analysis.")
+    pager_cols = st.columns([1, 1, 2])
+    with pager_cols[0]:
+        if st.button("⬅ Newer", disabled=len(cursors) == 1, key="history_newer"):
+            cursors.pop()
+            st.rerun()
+    with pager_cols[1]:
+        if st.button("Older ➡", disabled=next_cursor is None, key="history_older"):
+            cursors.append(next_cursor)
+            st.rerun()
+    with pager_cols[2]:
+        st.download_button("⬇️ Export filtered history (CSV)",
+                           data=lambda: history_store.export_csv(**history_filters),
+                           file_name="prediction_history_export.csv", mime="text/csv", key="history_export")
+
+    # --- WHAT-IF SWEEP ---
+    st.markdown("---")
+    st.markdown("### 🔬 What-if Sweep")
+    st.markdown(f"Vary one or two process inputs around the values entered in the Prediction tab and see how the predicted **{target}** responds for {diameter}mm.")
+    sweep_model = registry.get(make_model_key(target, diameter))
+    if sweep_model is None or not hasattr(sweep_model, "column_index"):
+        st.info("No model available for the selected diameter and target.")
+    else:
+        sweep_cols = st.columns(3)
+        with sweep_cols[0]:
+            x_param = st.selectbox("X parameter", INPUT_COLS, index=INPUT_COLS.index("PROCESS2"), key="sweep_x")
+        with sweep_cols[1]:
+            y_options = ["(none)"] + [c for c in INPUT_COLS if c != x_param]
+            y_param = st.selectbox("Y parameter", y_options, index=y_options.index("SPEED") if "SPEED" in y_options else 0, key="sweep_y")
+            y_param = None if y_param == "(none)" else y_param
+        with sweep_cols[2]:
+            sweep_steps = st.slider("Steps per axis", 10, 100, 50, 5, key="sweep_steps")
+        range_cols = st.columns(2)
+        sweep_ranges = {}
+        for col, param in zip(range_cols, [x_param, y_param]):
+            if param is None:
+                continue
+            lo, hi = default_range(sweep_model, param)
+            # Scale the slider to the parameter: CHEM spreads are ~1e-3, so a fixed 0.01 step would skip them
+            step = float(hi - lo) / 100 if hi > lo else 0.01
+            decimals = max(2, int(np.ceil(-np.log10(step))))
+            with col:
+                sweep_ranges[param] = st.slider(
+                    f"{param} range", 0.0, float(hi * 2) if hi > 0 else 1.0, (float(lo), float(hi)),
+                    step=step, format=f"%.{decimals}f", key=f"sweep_range_{param}"
+                )
+        if st.button("📈 Run Sweep", use_container_width=True):
+            base_record = {**current_inputs(), "GRADE": grade}
+            x_values = np.linspace(*sweep_ranges[x_param], sweep_steps)
+            y_values = np.linspace(*sweep_ranges[y_param], sweep_steps) if y_param else None
+            start = time.perf_counter()
+            sweep_df = run_sweep(sweep_model, base_record, x_param, x_values, y_param, y_values)
+            elapsed = time.perf_counter() - start
+            st.caption(f"Scored {len(sweep_df):,} grid points in {elapsed * 1000:.0f} ms")
+            if y_param is None:
+                st.line_chart(sweep_df.set_index(x_param)["prediction"])
+            else:
+                heatmap = alt.Chart(sweep_df).mark_rect().encode(
+                    x=alt.X(f"{x_param}:Q", bin=alt.Bin(maxbins=sweep_steps)),
+                    y=alt.Y(f"{y_param}:Q", bin=alt.Bin(maxbins=sweep_steps)),
+                    color=alt.Color("prediction:Q", title=target, scale=alt.Scale(scheme="viridis")),
+                    tooltip=[x_param, y_param, "prediction"],
+                )
+                st.altair_chart(heatmap, use_container_width=True)
+
+    # --- PROCESS OPTIMIZER ---
+    st.markdown("---")
+    st.markdown("### 🎯 Process Optimizer")
+    st.markdown(f"Keep the current chemistry and grade fixed and search TEMP, SPEED and PROCESS settings predicted to meet both quality minimums for {diameter}mm.")
+    optimizer_models = {t: registry.get(make_model_key(t, diameter)) for t in TARGETS}
+    if any(m is None or not hasattr(m, "column_index") for m in optimizer_models.values()):
+        st.info("Both QUALITY1 and QUALITY2 models are needed for the selected diameter.")
+    else:
+        opt_cols = st.columns(3)
+        opt_thresholds = {}
+        for col, target_name in zip(opt_cols, TARGETS):
+            with col:
+                opt_thresholds[target_name] = st.number_input(
+                    f"Minimum {target_name}", value=float(quality_threshold(target_name, grade)),
+                    key=f"opt_min_{target_name}_{grade}"
+                )
+        with opt_cols[2]:
+            time_budget = st.slider("Time budget (s)", 0.5, 10.0, 2.0, 0.5, key="opt_budget")
+        if st.button("🎯 Find Settings", use_container_width=True):
+            base_record = {**current_inputs(), "GRADE": grade}
+            with st.spinner("🔍 Searching process settings..."):
+                candidates, opt_info = optimize_process(
+                    optimizer_models, base_record, thresholds=opt_thresholds, time_budget=time_budget
+                )
+            st.caption(
+                f"Evaluated {opt_info['evaluations']:,} settings over {opt_info['generations']} generations "
+                f"in {opt_info['seconds']:.1f}s ({opt_info['evaluations_per_second']:,.0f}/s)"
+            )
+            if candidates["MEETS"].any():
+                st.success(f"✅ Found {int(candidates['MEETS'].sum())} setting(s) predicted to meet both minimums")
+            else:
+                st.warning("⚠ No setting met both minimums; showing the closest candidates")
+            st.dataframe(candidates, use_container_width=True)
+
+    # --- INPUT DRIFT ---
+    st.markdown("---")
+    st.markdown("### 📡 Input Drift")
+    st.markdown(f"Inputs scored for {diameter}mm over the last {WINDOW_SECONDS / 60:.0f} minutes, compared bin by bin with the training data.")
+    drift_rows = drift_monitor.scores(diameter)
+    if drift_rows is None:
+        st.info(f"No drift reference for {diameter}mm yet. Retrain with train_models.py to save one.")
+    elif drift_rows[0]["rows"] == 0:
+        st.info("No inputs scored in the current window yet.")
+    else:
+        drift_df = pd.DataFrame(drift_rows)
+        flagged = drift_df[drift_df["status"].isin(["moderate", "major"])]
+        if drift_rows[0]["rows"] < MIN_ROWS:
+            st.caption(f"Only {drift_rows[0]['rows']} rows in the window; scores settle after {MIN_ROWS}.")
+        elif len(flagged):
+            st.warning("⚠ Drifting inputs: " + ", ".join(f"{r.feature} (PSI {r.psi:.2f})" for r in flagged.itertuples()))
+        else:
+            st.success("✅ All inputs match the training distribution")
+        st.dataframe(drift_df.round(3), hide_index=True, use_container_width=True)
+        st.caption(
+            f"PSI ≥ {PSI_MODERATE} is a moderate shift and ≥ {PSI_MAJOR} a major one. KS is the largest gap "
+            "between the binned CDFs. Only bin counts are kept, never the raw inputs."
+        )
+
+    # --- SHADOW MODELS ---
+    shadow_summary = shadow.summary()
+    if shadow_summary:
+        st.markdown("---")
+        st.markdown("### 🧪 Shadow Models")
+        st.markdown("Candidates in models/shadow scored next to production on the same requests. Users only ever see production.")
+        shadow_df = pd.DataFrame.from_dict(shadow_summary, orient="index").rename_axis("model").reset_index()
+        st.dataframe(shadow_df.round(3), hide_index=True, use_container_width=True)
+        st.caption(
+            f"Rows that flip pass/fail or differ by more than {DIFF_TOLERANCE:g} are logged to "
+            "data/shadow_disagreements.jsonl. Promote a candidate with: python shadow.py promote <model>"
+        )
     st.markdown('</div>', unsafe_allow_html=True)
 
 # FAQ Tab
@@ -734,11 +751,11 @@ with tabs[3]:
         ("What is this tool used for?", "Predicts steel rebar quality using AI/ML based on your provided manufacturing data."),
         ("What do QUALITY1 and QUALITY2 mean?", "QUALITY1 is tensile strength, QUALITY2 is yield strength."),
         ("What diameters and grades are supported?", "10mm, 12mm, 16mm diameters; GR 1, GR 2, GR 3 grades."),
-        ("How do I interpret the confidence score?", "It's the model's estimated certainty, from 0 to 100%."),
+        ("How do I interpret the confidence score?", "It's one minus the width of the 90% interval relative to the prediction, so it drops when the forest's trees disagree. The interval shows the 5th–95th percentile of the individual tree predictions. Predictions whose confidence is below the sidebar Confidence Threshold get a warning."),
         ("Why is my batch not meeting standards?", "Check composition, temperature, and key process parameters for possible issues."),
-        ("Can I upload data for batch prediction?", "Currently, batch prediction is under development; stay tuned for updates."),
+        ("Can I upload data for batch prediction?", "Yes. Open **Batch Scoring** in the Prediction tab, upload a CSV/XLSX file and download the scored results."),
         ("How often are models updated?", "Models are updated quarterly based on new production and testing data."),
-        ("Is my data saved?", "No personal or input data is stored beyond your current session unless you download it."),
+        ("Is my data saved?", "Yes. Every prediction is logged on the server in data/history.sqlite with its timestamp, session ID, diameter, grade, full input values and result. That covers the Predict button, every scored row of a batch upload and requests to the HTTP scoring service (logged under session \"api\"). \"Clear History\" only hides your session's rows from your own view; they stay in the log. While a candidate model is being evaluated, rows where it disagrees with the production model (inputs included, from single predictions and batches) are also written to data/shadow_disagreements.jsonl."),
         ("How can I improve prediction accuracy?", "Ensure accurate inputs within typical ranges and consider recalibrating equipment periodically."),
     ]
     for question, answer in faqs:
@@ -767,3 +784,8 @@ st.markdown(f"""
     🔩 Rebar Quality Prediction App • Version 2.1 • Designed by <strong>Himansu</strong>
 </div>
 """, unsafe_allow_html=True)
+
+# --- METRICS ---
+metrics.observe("rerun", time.perf_counter() - rerun_start)
+if os.environ.get("QUALITY_METRICS_FILE"):
+    metrics.write_prometheus(os.environ["QUALITY_METRICS_FILE"])
@@ -0,0 +1,260 @@
+"""Training and inference benchmarks on synthetic plant data.
+
+Synthetic frames follow the layout and rough distributions of the
+Diameter_{10,12,16}.xlsx exports, so the suite runs without the real
+workbooks. Every run records one flat {metric: value} dict in a JSON
+file. With --baseline, each metric is compared with an earlier run, and
+the script exits non-zero if any metric got worse by more than
+--threshold (a fraction; 0.2 = 20%).
+
+    python benchmark.py                                    # -> benchmark_results.json
+    python benchmark.py --batch-sizes 1000 100000 --output new.json \\
+        --baseline benchmark_results.json --threshold 0.2
+
+Metrics ending in _per_s are higher-is-better; all others (seconds,
+milliseconds, megabytes) are lower-is-better.
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import RandomForestRegressor
+
+from forest_engine import engine_enabled
+from model_format import FOREST_SUFFIX
+from pipeline import QualityPipeline, compile_model, export_pipeline, load_packed_pipeline
+from scoring import CHEM_COLS, DIAMETERS, GRADES, TARGETS, build_input_matrix, normalize_columns, normalize_record
+
+# (mean, std, min, max) of the plant exports across all diameters
+COLUMN_STATS = {
+    "CHEM1": (0.225, 0.0099, 0.164, 0.257),
+    "CHEM2": (1.238, 0.167, 0.694, 1.595),
+    "CHEM3": (0.0172, 0.0043, 0.006, 0.06),
+    "CHEM4": (0.0248, 0.0049, 0.0125, 0.04),
+    "CHEM5": (0.226, 0.024, 0.14, 0.333),
+    "CHEM6": (0.00255, 0.00056, 0.001, 0.006),
+    "CHEM7": (0.00077, 0.0007, 0.0001, 0.004),
+    "CHEM8": (0.029, 0.0062, 0.015, 0.119),
+    "CHEM9": (0.0061, 0.0056, 0.001, 0.289),
+    "CHEM10": (53.7, 7.34, 30.0, 108.0),
+    "TEMP1": (999.9, 89.8, 820.0, 1158.0),
+    "TEMP2": (991.0, 84.8, 820.0, 1139.0),
+    "TEMP3": (71.3, 41.9, 0.0, 151.0),
+    "TEMP4": (157.8, 92.0, 0.0, 323.0),
+    "TEMP5": (580.2, 39.5, 501.0, 649.0),
+    "TEMP6": (551.8, 32.7, 500.0, 638.0),
+    "SPEED": (21.0, 6.88, 11.0, 32.0),
+    "PROCESS1": (2515.5, 535.5, 1389.0, 3576.0),
+    "PROCESS2": (2659.4, 568.3, 1466.0, 3738.0),
+    # Exported with the plant's spelling; normalize_columns renames it
+    "PEOCESS3": (1.323, 0.041, 0.85, 1.4),
+}
+GRADE_SHARES = [0.77, 0.09, 0.14]
+# Target mean/std and the grade offsets seen in the exports
+TARGET_STATS = {"QUALITY1": (717.0, 20.3, [0.0, -8.0, -38.0]), "QUALITY2": (605.0, 17.2, [0.0, -4.0, -30.0])}
+BATCH_BLOCK_ROWS = 100_000
+
+
+def synthetic_frame(n_rows, diameter=10, seed=0):
+    """A Diameter_{d}.xlsx-shaped frame with correlated QUALITY1/QUALITY2 targets"""
+    rng = np.random.default_rng(seed)
+    data = {
+        "DATE_TIME": pd.Timestamp("2022-01-01") + pd.to_timedelta(np.sort(rng.uniform(0, 7e7, n_rows)), unit="s"),
+        "DIAMETER": np.full(n_rows, float(diameter)),
+        "GRADE": rng.choice(GRADES, size=n_rows, p=GRADE_SHARES),
+    }
+    z = {}
+    for col, (mean, std, low, high) in COLUMN_STATS.items():
+        z[col] = rng.standard_normal(n_rows)
+        data[col] = np.clip(mean + std * z[col], low, high)
+    grade_idx = pd.Series(data["GRADE"]).map({g: i for i, g in enumerate(GRADES)}).to_numpy()
+    # A fixed mix of chemistry and process terms plus an interaction, so the trees have structure to find
+    signal = (
+        0.5 * z["CHEM1"] + 0.3 * z["CHEM2"] - 0.2 * z["TEMP5"] + 0.2 * z["SPEED"] * z["TEMP1"]
+        + 0.15 * np.sin(z["PROCESS2"]) + 0.1 * sum(z[c] for c in CHEM_COLS[2:6])
+    )
+    noise = rng.standard_normal(n_rows)
+    for target, (mean, std, grade_offset) in TARGET_STATS.items():
+        data[target] = mean + np.asarray(grade_offset)[grade_idx] + std * (0.6 * signal + 0.4 * noise)
+    data["ID"] = [f"A{i:05d}" for i in rng.integers(0, 100_000, n_rows)]
+    return pd.DataFrame(data)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def timed_ms(fn, repeats, warmup=20):
+    """Wall time of each call in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples[i] = time.perf_counter() - start
+    return samples * 1000
+
+
+def bench_train(results, diameters, train_rows, n_trees, n_jobs, out_dir):
+    """Fit and save one pipeline per (diameter, target); returns the artifact paths"""
+    artifacts = {}
+    for d in diameters:
+        df = normalize_columns(synthetic_frame(train_rows, d, seed=d))
+        X = build_input_matrix(df)
+        for target in TARGETS:
+            start = time.perf_counter()
+            model = RandomForestRegressor(n_estimators=n_trees, random_state=42, n_jobs=n_jobs)
+            pipeline = QualityPipeline.fit(X, df[target].to_numpy(), model, target=target, diameter=d)
+            model.set_params(n_jobs=None)
+            results[f"train.d{d}.{target.lower()}_s"] = time.perf_counter() - start
+
+            key = f"{target.lower()}_d{d}"
+            pkl_path = os.path.join(out_dir, f"{key}.pkl")
+            start = time.perf_counter()
+            with open(pkl_path, "wb") as f:
+                pickle.dump(pipeline, f)
+            forest_path = export_pipeline(pipeline, os.path.join(out_dir, f"{key}{FOREST_SUFFIX}"))
+            results[f"export.d{d}.{target.lower()}_s"] = time.perf_counter() - start
+            artifacts[key] = (pkl_path, forest_path)
+            print(f"⏱ {key}: trained in {results[f'train.d{d}.{target.lower()}_s']:.2f}s")
+    return artifacts
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return compile_model(pickle.load(f))
+
+
+def bench_load(results, pkl_path, forest_path, repeats):
+    results["load.pickle_ms"] = float(np.median(timed_ms(lambda: load_pickle(pkl_path), repeats, warmup=1)))
+    results["load.forest_ms"] = float(np.median(
+        timed_ms(lambda: load_packed_pipeline(forest_path), repeats, warmup=1)
+    ))
+    print(f"📦 load: pickle {results['load.pickle_ms']:.1f} ms • packed {results['load.forest_ms']:.1f} ms")
+
+
+def bench_latency(results, name, model, record, repeats):
+    """1-row predict and predict_with_uncertainty latency percentiles"""
+    x = model.vector_from_record(record)
+    for label, fn in (("predict", lambda: model.predict(x)),
+                      ("uncertainty", lambda: model.predict_with_uncertainty(x))):
+        samples = timed_ms(fn, repeats)
+        results[f"latency.{name}.{label}_p50_ms"] = float(np.percentile(samples, 50))
+        results[f"latency.{name}.{label}_p99_ms"] = float(np.percentile(samples, 99))
+    print(f"⚡ {name} 1-row: p50 {results[f'latency.{name}.predict_p50_ms']:.3f} ms • "
+          f"p99 {results[f'latency.{name}.predict_p99_ms']:.3f} ms")
+
+
+def bench_batch(results, model, sizes, block_rows=BATCH_BLOCK_ROWS):
+    """Rows per second for each batch size; big batches are scored in blocks to bound memory"""
+    block = build_input_matrix(normalize_columns(synthetic_frame(min(max(sizes), block_rows), seed=1)))
+    for size in sizes:
+        start = time.perf_counter()
+        done = 0
+        while done < size:
+            n = min(block_rows, size - done)
+            model.predict(block[:n])
+            done += n
+        elapsed = time.perf_counter() - start
+        results[f"batch.{size}.rows_per_s"] = size / elapsed
+        print(f"📊 batch {size:,}: {size / elapsed:,.0f} rows/s")
+
+
+def run(args):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="quality-bench-") as out_dir:
+        artifacts = bench_train(results, args.diameters, args.train_rows, args.trees, args.n_jobs, out_dir)
+        key = f"quality1_d{args.diameters[0]}"
+        pkl_path, forest_path = artifacts[key]
+        bench_load(results, pkl_path, forest_path, args.load_repeats)
+
+        serving = load_packed_pipeline(forest_path) if engine_enabled() else load_pickle(pkl_path)
+        with open(pkl_path, "rb") as f:
+            reference = pickle.load(f)
+        record = normalize_record(synthetic_frame(1, args.diameters[0], seed=7).iloc[0].to_dict())
+        bench_latency(results, "serving", serving, record, args.repeats)
+        bench_latency(results, "sklearn", reference, record, min(args.repeats, 200))
+        bench_batch(results, serving, args.batch_sizes)
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Metrics that got worse than baseline by more than threshold: [(name, old, new, change)]"""
+    regressions = []
+    for name, new in results.items():
+        old = baseline.get(name)
+        if not old or not isinstance(new, (int, float)):
+            continue
+        change = (old - new) / old if name.endswith("_per_s") else (new - old) / old
+        if change > threshold:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark training and inference on synthetic data")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for this run")
+    parser.add_argument("--baseline", help="Earlier JSON run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed slowdown as a fraction of the baseline (default: 0.2)")
+    parser.add_argument("--diameters", nargs="+", type=int, default=DIAMETERS)
+    parser.add_argument("--train-rows", type=int, default=2000,
+                        help="Synthetic rows per diameter (the exports have ~1.4-1.9k)")
+    parser.add_argument("--trees", type=int, default=100)
+    parser.add_argument("--n-jobs", type=int, default=1, help="Training threads per forest")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeats", type=int, default=1000, help="1-row predictions per latency metric")
+    parser.add_argument("--load-repeats", type=int, default=5)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    results = run(args)
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "sklearn": sklearn.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "engine": "numpy" if engine_enabled() else "sklearn",
+            "args": vars(args),
+            "wall_s": time.perf_counter() - start,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Wrote {len(results)} metrics to {args.output} (peak RSS {results['peak_rss_mb']:.0f} MB)")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new, change in regressions:
+            print(f"❌ {name}: {old:.4g} -> {new:.4g} ({change:+.0%} worse)")
+        if regressions:
+            return 1
+        print(f"✅ No metric regressed by more than {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Headless benchmark of interaction-to-result latency in the Streamlit app.
+
+app.py runs under streamlit.testing's AppTest, with no browser and no
+server. Each scenario replays one user interaction and times the script
+run that follows it, up to the point where the result is rendered:
+
+- cold: first run in a fresh process (imports, registry, first model load)
+- rerun: a rerun with nothing changed
+- edit_input: change one composition input
+- predict: change an input and click Predict (cache miss every time)
+- theme_toggle: switch between light and dark mode
+- fragment_edit_input / fragment_predict: the same interactions as
+  fragment-scoped reruns, the way the browser sends them. AppTest always
+  reruns the whole script, so these replay the fragment through the
+  script runner directly. They are skipped when the app defines no
+  fragments.
+
+Predictions are logged to a throwaway history database. Results use the
+benchmark.py JSON layout, so --baseline/--threshold work the same way.
+
+    python benchmark_app.py                                # -> benchmark_app_results.json
+    python benchmark_app.py --repeats 50 --output new.json --baseline benchmark_app_results.json
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def summarize(name, samples):
+    """{name}_p50_ms / {name}_p95_ms from a list of seconds"""
+    ms = np.asarray(samples) * 1000
+    return {f"{name}_p50_ms": float(np.percentile(ms, 50)), f"{name}_p95_ms": float(np.percentile(ms, 95))}
+
+
+def timed_run(at, timeout):
+    start = time.perf_counter()
+    at.run(timeout=timeout)
+    elapsed = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(f"App raised: {at.exception[0].value}")
+    return elapsed
+
+
+def predict_button(at):
+    return next(b for b in at.button if "Predict" in b.label)
+
+
+def run_fragment(at, fragment_id, timeout):
+    """Rerun only fragment_id with the current widget state, as a browser interaction would"""
+    from streamlit.testing.v1 import local_script_runner
+
+    rerun_data = functools.partial(local_script_runner.RerunData, fragment_id_queue=[fragment_id])
+    widget_state = at._tree.get_widget_states()
+    start = time.perf_counter()
+    with mock.patch.object(local_script_runner, "RerunData", rerun_data):
+        at._run(widget_state, timeout=timeout)
+    return time.perf_counter() - start
+
+
+def run(args):
+    from streamlit.testing.v1 import AppTest
+
+    results = {}
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    results["cold_ms"] = timed_run(at, args.timeout) * 1000
+    # One prediction first, so every scenario runs with a model loaded
+    predict_button(at).click()
+    timed_run(at, args.timeout)
+
+    samples = [timed_run(at, args.timeout) for _ in range(args.repeats)]
+    results.update(summarize("rerun", samples))
+
+    rng = np.random.default_rng(0)
+    samples = []
+    for _ in range(args.repeats):
+        at.number_input[0].set_value(round(float(rng.uniform(0.1, 0.3)), 2))
+        samples.append(timed_run(at, args.timeout))
+    results.update(summarize("edit_input", samples))
+
+    samples = []
+    for i in range(args.repeats):
+        at.number_input[1].set_value(round(0.01 * (i + 1), 2))
+        predict_button(at).click()
+        samples.append(timed_run(at, args.timeout))
+    results.update(summarize("predict", samples))
+
+    samples = []
+    for _ in range(args.repeats):
+        at.button(key="theme_toggle").click()
+        samples.append(timed_run(at, args.timeout))
+    results.update(summarize("theme_toggle", samples))
+
+    fragment_ids = list(at._fragment_storage._fragments)
+    if fragment_ids:
+        for name, click in (("fragment_edit_input", False), ("fragment_predict", True)):
+            samples = []
+            for i in range(args.repeats):
+                at.number_input[1].set_value(round(0.01 * (i + 1) + 0.005, 3))
+                if click:
+                    predict_button(at).click()
+                samples.append(run_fragment(at, fragment_ids[0], args.timeout))
+                # Reset the tree (and the button trigger) with a full run between samples
+                at.run(timeout=args.timeout)
+            results.update(summarize(name, samples))
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark app interactions headlessly with AppTest")
+    parser.add_argument("--output", default="benchmark_app_results.json", help="JSON file for this run")
+    parser.add_argument("--baseline", help="Earlier JSON run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed slowdown as a fraction of the baseline (default: 0.2)")
+    parser.add_argument("--repeats", type=int, default=30, help="Interactions timed per scenario")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds allowed per script run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Set before app.py imports history_store, which reads it at import time
+        os.environ["QUALITY_HISTORY_DB"] = os.path.join(tmp, "history.sqlite")
+        start = time.perf_counter()
+        results = run(args)
+        wall = time.perf_counter() - start
+
+    import streamlit
+    from benchmark import compare
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+            "wall_s": wall,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    for name, value in results.items():
+        print(f"⏱ {name:<28} {value:10.1f}")
+    print(f"💾 Wrote {len(results)} metrics to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new, change in regressions:
+            print(f"❌ {name}: {old:.4g} -> {new:.4g} ({change:+.0%} worse)")
+        if regressions:
+            return 1
+        print(f"✅ No metric regressed by more than {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
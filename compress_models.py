@@ -0,0 +1,311 @@
+"""Post-training compression of the serving forests.
+
+For every (diameter, target) model, smaller variants of the packed forest
+are built:
+
+- subset: the k trees picked by greedy forward selection on out-of-bag
+  error (trees are only scored on training rows they never saw)
+- depth: every tree cut at a maximum depth; a node at the cap becomes a
+  leaf carrying its mean, so no refit is needed
+- subset + depth combinations of the two
+- distill_tree: one shallow CART tree fit to the forest's predictions on
+  the training rows plus jittered copies of them. It is stored as a
+  1-tree .forest, so it can be served like any other forest, but its
+  prediction interval collapses to a point (std 0, confidence always
+  100%). It is only eligible for selection with --allow-single-tree.
+- distill_hgb: HistGradientBoosting fit the same way. It is for
+  comparison only, because serving needs per-tree outputs for the
+  interval and the confidence score.
+
+Each variant is scored on the same held-out split as train_models.py.
+The report gives error, artifact size, load time, and 1-row and batch
+latency. The fastest servable variant (two or more trees, unless
+--allow-single-tree) whose MAE is within --tolerance
+of the full forest is marked as chosen. The report is written to
+models/{key}.compression.json. With --apply, the chosen variant replaces
+models/{key}.forest, and the app's model watcher hot-swaps it in. The
+pickle keeps the full forest, so train_models.py --incremental refuses
+to grow a compressed model; retrain it in full and compress again.
+
+    python compress_models.py
+    python compress_models.py --diameters 10 --tolerance 0.01 --apply
+"""
+import argparse
+import json
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+from sklearn.model_selection import train_test_split
+
+from model_format import FOREST_SUFFIX, pack_forest, read_forest, write_forest
+from pipeline import load_packed_pipeline
+from scoring import build_input_matrix
+from train_models import diameters, latency_ms, load_diameter_frame, model_dir, targets, test_metrics
+
+TREE_COUNTS = [10, 25, 50]
+DEPTHS = [6, 8, 12]
+DISTILL_DEPTHS = [6, 8, 10]
+# Jittered copies of each training row used as extra distillation inputs
+DISTILL_COPIES = 10
+DISTILL_NOISE = 0.1
+
+
+def forest_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def extract_trees(arrays, meta, tree_ids, max_depth=None):
+    """Packed arrays of the given trees, cut at max_depth, with unreachable nodes dropped"""
+    left, right = arrays["left"].copy(), arrays["right"].copy()
+    feature, threshold = arrays["feature"].copy(), arrays["threshold"].copy()
+    roots = np.asarray(arrays["roots"])[tree_ids]
+    kept = []
+    frontier = roots
+    depth = 0
+    while frontier.size:
+        kept.append(frontier)
+        internal = frontier[left[frontier] != frontier]
+        if max_depth is not None and depth == max_depth:
+            # Cut here: the node's mean value is already stored, so it becomes the leaf output
+            left[internal] = right[internal] = internal
+            feature[internal], threshold[internal] = 0, 0.0
+            break
+        if internal.size == 0:
+            break
+        frontier = np.concatenate([left[internal], right[internal]])
+        depth += 1
+    nodes = np.unique(np.concatenate(kept))
+    packed = {
+        "roots": np.searchsorted(nodes, roots),
+        "left": np.searchsorted(nodes, left[nodes]),
+        "right": np.searchsorted(nodes, right[nodes]),
+        "feature": feature[nodes],
+        "threshold": threshold[nodes],
+        "value": np.asarray(arrays["value"])[nodes],
+        "missing_left": np.asarray(arrays["missing_left"])[nodes],
+    }
+    packed_meta = {**meta, "n_trees": len(roots), "n_nodes": int(len(nodes)), "max_depth": int(depth)}
+    return packed, packed_meta
+
+
+def oob_tree_predictions(forest, Z):
+    """(n_rows, n_trees) per-tree predictions and a mask of rows each tree never trained on"""
+    P = np.column_stack([est.predict(Z.astype(np.float32)) for est in forest.estimators_])
+    oob = np.ones(P.shape, dtype=bool)
+    for t, sample in enumerate(forest.estimators_samples_):
+        oob[sample, t] = False
+    return P, oob
+
+
+def select_trees(P, oob, y, k):
+    """Greedy forward selection of k trees minimizing out-of-bag MAE"""
+    sums = np.zeros(len(y))
+    counts = np.zeros(len(y))
+    remaining = list(range(P.shape[1]))
+    chosen = []
+    for _ in range(min(k, len(remaining))):
+        cand_sums = sums[:, None] + np.where(oob[:, remaining], P[:, remaining], 0.0)
+        cand_counts = counts[:, None] + oob[:, remaining]
+        covered = cand_counts > 0
+        errors = np.where(covered, np.abs(y[:, None] - cand_sums / np.maximum(cand_counts, 1)), 0.0)
+        mae = errors.sum(axis=0) / np.maximum(covered.sum(axis=0), 1)
+        best = remaining.pop(int(np.argmin(mae)))
+        chosen.append(best)
+        sums += np.where(oob[:, best], P[:, best], 0.0)
+        counts += oob[:, best]
+    return chosen
+
+
+def distill_inputs(Z, copies=DISTILL_COPIES, noise=DISTILL_NOISE, seed=0):
+    """Training rows plus jittered copies (noise in standard-scaled units)"""
+    rng = np.random.default_rng(seed)
+    jittered = np.repeat(Z, copies, axis=0)
+    jittered += rng.normal(0.0, noise, size=jittered.shape)
+    return np.vstack([Z, jittered])
+
+
+def evaluate(name, model, X_test, y_test, X_batch, repeats, path=None, servable=True, base=None):
+    """One report row: held-out error, artifact size, load time and latency"""
+    scores = test_metrics(y_test, model.predict(X_test))
+    row = {"variant": name, **scores, "servable": servable}
+    engine = getattr(model, "model", model)
+    row["trees"] = getattr(engine, "n_trees", None)
+    row["depth"] = getattr(engine, "max_depth", None)
+    if path is not None:
+        row["size_kb"] = forest_size(path) / 1024
+        start = time.perf_counter()
+        load_packed_pipeline(path)
+        row["load_ms"] = (time.perf_counter() - start) * 1000
+    else:
+        row["size_kb"] = len(pickle.dumps(model)) / 1024
+        row["load_ms"] = None
+    row["latency_ms"] = latency_ms(model, X_test, repeats)
+    start = time.perf_counter()
+    model.predict(X_batch)
+    row["batch_ms"] = (time.perf_counter() - start) * 1000
+    row["mae_change"] = scores["mae"] / base["mae"] - 1 if base else 0.0
+    return row
+
+
+def compress_model(d, target, df, work_dir, tree_counts=TREE_COUNTS, depths=DEPTHS,
+                   distill_depths=DISTILL_DEPTHS, with_hgb=True, tolerance=0.02,
+                   batch_rows=10_000, repeats=200, apply=False, allow_single_tree=False):
+    """Build, score and report the compressed variants of one model; returns the report"""
+    key = f"{target.lower()}_d{d}"
+    forest_path = os.path.join(model_dir, f"{key}{FOREST_SUFFIX}")
+    if not os.path.isdir(forest_path):
+        print(f"⚠️ No packed forest for {key}; run train_models.py first")
+        return None
+    print(f"🗜 Compressing {key}...")
+
+    # Same rows and split as train_models.train_model, so the test rows stay unseen
+    temp_df = df.dropna(subset=[target])
+    X = build_input_matrix(temp_df)
+    y = temp_df[target].to_numpy()
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_batch = X_test[np.arange(batch_rows) % len(X_test)]
+
+    arrays, meta = read_forest(forest_path, mmap=False)
+    if "compression" in meta:
+        print(f"⚠️ {key} is already a compressed variant ({meta['compression']['variant']}); retrain it first")
+        return None
+    full = load_packed_pipeline(forest_path)
+    Z_train = full.transform(X_train)
+    rows = [evaluate("full", full, X_test, y_test, X_batch, repeats, path=forest_path)]
+    base = rows[0]
+
+    # Tree order for subsets: greedy out-of-bag selection when the fitted forest and its
+    # training rows are still at hand, otherwise the first k (trees are i.i.d.).
+    # Bootstrap masks are only valid for forests fit in one go: sklearn redraws them from
+    # the last fit's row count, which for a forest grown with --incremental is the new rows only.
+    order = list(range(meta["n_trees"]))
+    pickle_path = os.path.join(model_dir, f"{key}.pkl")
+    if os.path.exists(pickle_path):
+        with open(pickle_path, "rb") as f:
+            fitted = pickle.load(f)
+        forest = getattr(fitted, "model", None)
+        watermark = getattr(fitted, "watermark", None) or {}
+        if watermark.get("incremental"):
+            print(f"⚠️ {key} was grown with --incremental: subsets use the first k trees, and the "
+                  "held-out rows may include rows the added trees were fit on")
+        elif (hasattr(forest, "estimators_samples_") and watermark.get("rows") == len(df)
+                and getattr(forest, "_n_samples", None) == len(X_train)):
+            P, oob = oob_tree_predictions(forest, Z_train)
+            order = select_trees(P, oob, y_train, max(tree_counts, default=0))
+        else:
+            print(f"⚠️ {key}: training rows changed since the fit; subsets use the first k trees")
+
+    variants = []
+    for k in [None] + sorted(tree_counts, reverse=True):
+        for depth in [None] + sorted(depths, reverse=True):
+            if k is None and depth is None:
+                continue
+            name = "_".join(part for part in (k and f"k{k}", depth and f"depth{depth}") if part)
+            tree_ids = order[:k] if k else list(range(meta["n_trees"]))
+            variants.append((name, *extract_trees(arrays, meta, tree_ids, depth)))
+
+    # Distillation: students learn the forest's function, not the noisy labels
+    Z_distill = distill_inputs(Z_train)
+    teacher = full.model.predict(Z_distill)
+    for depth in distill_depths:
+        student = RandomForestRegressor(n_estimators=1, bootstrap=False, max_features=1.0,
+                                        max_depth=depth, random_state=42)
+        student.fit(Z_distill, teacher)
+        student_arrays, student_meta = pack_forest(student)
+        student_meta["feature_importances"] = student.feature_importances_.tolist()
+        variants.append((f"distill_tree{depth}", student_arrays, {**meta, **student_meta}))
+
+    for name, variant_arrays, variant_meta in variants:
+        path = os.path.join(work_dir, f"{key}.{name}{FOREST_SUFFIX}")
+        variant_meta = {**variant_meta, "compression": {"variant": name, "source_trees": meta["n_trees"]}}
+        write_forest(variant_arrays, variant_meta, path)
+        # One tree has no spread, so it would zero the interval and the confidence gate
+        servable = variant_meta["n_trees"] > 1 or allow_single_tree
+        rows.append(evaluate(name, load_packed_pipeline(path), X_test, y_test, X_batch, repeats,
+                             path=path, servable=servable, base=base))
+
+    if with_hgb:
+        hgb = HistGradientBoostingRegressor(max_iter=200, random_state=42).fit(Z_distill, teacher)
+        rows.append(evaluate("distill_hgb", full.with_model(hgb), X_test, y_test, X_batch, repeats,
+                             servable=False, base=base))
+
+    report = pd.DataFrame(rows)
+    within = report[report["servable"] & (report["mae_change"] <= tolerance)]
+    chosen = within.sort_values(["latency_ms", "size_kb"]).iloc[0]["variant"]
+    print_report(key, report, chosen, tolerance)
+
+    summary = {"tolerance": tolerance, "chosen": chosen, "applied": False,
+               "variants": json.loads(report.to_json(orient="records"))}
+    if apply and chosen != "full":
+        write_forest(*read_forest(os.path.join(work_dir, f"{key}.{chosen}{FOREST_SUFFIX}"), mmap=False),
+                     forest_path)
+        summary["applied"] = True
+        print(f"✅ {key}: serving {chosen} from {forest_path}")
+    with open(os.path.join(model_dir, f"{key}.compression.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def print_report(key, report, chosen, tolerance):
+    print(f"📋 {key} (MAE tolerance {tolerance:.0%} over the full forest)")
+    print(f"   {'variant':<16}{'trees':>6}{'depth':>6}{'MAE':>8}{'ΔMAE':>8}{'R²':>7}"
+          f"{'KB':>9}{'load ms':>9}{'1-row ms':>10}{'batch ms':>10}")
+    for row in report.itertuples():
+        mark = "⭐" if row.variant == chosen else ("  " if row.servable else "🚫")
+        trees = "-" if pd.isna(row.trees) else f"{int(row.trees)}"
+        depth = "-" if pd.isna(row.depth) else f"{int(row.depth)}"
+        load = "-" if pd.isna(row.load_ms) else f"{row.load_ms:.1f}"
+        print(f"{mark} {row.variant:<16}{trees:>6}{depth:>6}{row.mae:>8.2f}{row.mae_change:>+8.1%}{row.r2:>7.3f}"
+              f"{row.size_kb:>9.0f}{load:>9}{row.latency_ms:>10.3f}{row.batch_ms:>10.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build and compare compressed serving forests")
+    parser.add_argument("--diameters", nargs="+", default=diameters)
+    parser.add_argument("--targets", nargs="+", default=targets, type=str.upper)
+    parser.add_argument("--trees", nargs="+", type=int, default=TREE_COUNTS,
+                        help="Tree counts for subset variants (default: 10 25 50)")
+    parser.add_argument("--depths", nargs="+", type=int, default=DEPTHS,
+                        help="Depth caps (default: 6 8 12)")
+    parser.add_argument("--distill-depths", nargs="+", type=int, default=DISTILL_DEPTHS,
+                        help="Depths of the distilled single trees (default: 6 8 10)")
+    parser.add_argument("--no-hgb", action="store_true", help="Skip the HistGradientBoosting student")
+    parser.add_argument("--tolerance", type=float, default=0.02,
+                        help="Allowed relative MAE increase over the full forest (default: 0.02)")
+    parser.add_argument("--batch-rows", type=int, default=10_000, help="Rows in the batch latency test")
+    parser.add_argument("--repeats", type=int, default=200, help="1-row predictions per latency measurement")
+    parser.add_argument("--apply", action="store_true",
+                        help="Replace models/{key}.forest with the chosen variant")
+    parser.add_argument("--allow-single-tree", action="store_true",
+                        help="Let 1-tree variants (distill_tree*) be chosen, giving up the prediction interval")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="quality-compress-") as work_dir:
+        for d in args.diameters:
+            df = load_diameter_frame(d)
+            if df is None:
+                continue
+            for target in args.targets:
+                if target not in df.columns:
+                    print(f"⚠️ Skipping {target} for diameter {d} (not in data)")
+                    continue
+                compress_model(
+                    d, target, df, work_dir, tree_counts=args.trees, depths=args.depths,
+                    distill_depths=args.distill_depths, with_hgb=not args.no_hgb,
+                    tolerance=args.tolerance, batch_rows=args.batch_rows, repeats=args.repeats,
+                    apply=args.apply, allow_single_tree=args.allow_single_tree,
+                )
+    print(f"🎉 Compression report finished in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
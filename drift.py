@@ -0,0 +1,262 @@
+"""Input-drift monitoring against the training distributions.
+
+train_models.py saves one reference per diameter (models/drift_d{d}.json).
+For every input feature it stores:
+- decile bin edges of the training rows;
+- the share of training rows in each bin, plus a missing-value bin;
+- a few quantiles for display.
+
+At serving time, DriftMonitor bins every row scored by the app or the
+server against the same edges. It keeps only a ring of per-slot bin
+counts (metrics.SlotRing, as the latency histograms do). Memory is fixed by features x bins x
+slots however much traffic flows through, and raw inputs are never kept.
+Each feature's rolling-window histogram is compared with its reference:
+
+- PSI over all bins, missing included (>= 0.1 moderate, >= 0.25 major)
+- KS: the largest gap between the binned CDFs of the non-missing values
+
+A stuck sensor, such as TEMP3 left at the UI default of 0, drops every
+row into the lowest bin. PSI jumps within a few dozen predictions.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from metrics import SlotRing
+from scoring import INPUT_COLS, MODEL_DIR, build_input_matrix, normalize_columns, normalize_record
+
+N_BINS = 10
+WINDOW_SECONDS = float(os.environ.get("QUALITY_DRIFT_WINDOW", 3600))
+WINDOW_SLOTS = 12
+MIN_ROWS = 30
+PSI_MODERATE = 0.1
+PSI_MAJOR = 0.25
+QUANTILES = (0.05, 0.5, 0.95)
+# Floor for empty bins, so PSI stays finite
+EPS = 1e-4
+
+_monitors = {}
+_monitors_lock = threading.Lock()
+
+
+def reference_path(model_dir, diameter):
+    return os.path.join(model_dir, f"drift_d{int(float(diameter))}.json")
+
+
+def build_reference(X, diameter, feature_names=INPUT_COLS, n_bins=N_BINS):
+    """Per-feature bin edges, bin shares and quantiles of a raw training matrix"""
+    edges, expected, quantiles = [], [], []
+    for j in range(X.shape[1]):
+        values = X[:, j][~np.isnan(X[:, j])]
+        if len(values):
+            cuts = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]))
+            counts = np.bincount(np.searchsorted(cuts, values), minlength=len(cuts) + 1)
+            quantiles.append(np.quantile(values, QUANTILES).tolist())
+        else:
+            cuts, counts = np.array([]), np.zeros(1, dtype=np.int64)
+            quantiles.append([None] * len(QUANTILES))
+        counts = np.append(counts, len(X) - len(values))
+        edges.append(cuts.tolist())
+        expected.append((counts / max(len(X), 1)).tolist())
+    return {
+        "diameter": int(float(diameter)),
+        "rows": int(len(X)),
+        "features": list(feature_names),
+        "edges": edges,
+        "expected": expected,
+        "quantiles": quantiles,
+    }
+
+
+def save_reference(reference, path):
+    """Write a reference atomically, so a running monitor never reads half a file"""
+    with open(path + ".tmp", "w") as f:
+        json.dump(reference, f)
+    os.replace(path + ".tmp", path)
+
+
+def psi(actual, expected):
+    """Population stability index between two share vectors"""
+    actual = np.maximum(actual, EPS)
+    expected = np.maximum(expected, EPS)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def binned_ks(actual_counts, expected):
+    """Largest CDF gap over the bin edges, ignoring the missing bin; None without data"""
+    actual_counts, expected = actual_counts[:-1], np.asarray(expected[:-1])
+    if actual_counts.sum() == 0 or expected.sum() == 0:
+        return None
+    gap = np.cumsum(actual_counts) / actual_counts.sum() - np.cumsum(expected) / expected.sum()
+    return float(np.abs(gap).max())
+
+
+class DriftSketch:
+    """Rolling per-feature bin counts for one diameter's reference"""
+
+    def __init__(self, reference, window_seconds=WINDOW_SECONDS, slots=WINDOW_SLOTS):
+        self.reference = reference
+        self.features = reference["features"]
+        self.feature_index = {name: j for j, name in enumerate(self.features)}
+        # Ragged edges padded with +inf to one (features, max_bins) block;
+        # padded bins never receive rows and add nothing to PSI or KS
+        width = max(len(e) for e in reference["edges"]) + 1
+        self.n_cells = width + 1
+        self.edges = [np.asarray(e, dtype=np.float64) for e in reference["edges"]]
+        self.expected = np.zeros((len(self.features), self.n_cells))
+        for j, shares in enumerate(reference["expected"]):
+            self.expected[j, :len(shares) - 1] = shares[:-1]
+            self.expected[j, -1] = shares[-1]
+        self.offsets = np.arange(len(self.features)) * self.n_cells
+        # Per-slot bin counts; the slot sums count the rows
+        self.ring = SlotRing((len(self.features), self.n_cells), window_seconds, slots)
+        self.total_rows = 0
+        self._lock = threading.Lock()
+
+    def observe(self, X, now=None):
+        """Add the rows of a raw (n, features) matrix in reference column order"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        if not len(X):
+            return
+        bins = np.empty(X.shape, dtype=np.int64)
+        for j, cuts in enumerate(self.edges):
+            bins[:, j] = np.searchsorted(cuts, X[:, j])
+        bins[np.isnan(X)] = self.n_cells - 1
+        counts = np.bincount((bins + self.offsets).ravel(), minlength=len(self.features) * self.n_cells)
+        with self._lock:
+            self.ring.add(..., counts.reshape(len(self.features), self.n_cells), value=len(X), now=now)
+            self.total_rows += len(X)
+
+    def window(self, now=None):
+        """(bin counts per feature, rows) over the slots still inside the window"""
+        with self._lock:
+            counts, rows = self.ring.window(now)
+        return counts, int(rows)
+
+    def scores(self, now=None):
+        """One row per feature: PSI, KS and missing share over the window, worst PSI first"""
+        counts, n = self.window(now)
+        rows = []
+        for j, name in enumerate(self.features):
+            low, median, high = self.reference["quantiles"][j]
+            row = {
+                "feature": name,
+                "rows": n,
+                "psi": psi(counts[j] / n, self.expected[j]) if n else None,
+                "ks": binned_ks(counts[j], self.expected[j]) if n else None,
+                "missing": counts[j, -1] / n if n else None,
+                "train_missing": float(self.expected[j, -1]),
+                "train_p05": low,
+                "train_p50": median,
+                "train_p95": high,
+            }
+            row["status"] = drift_status(row["psi"], n)
+            rows.append(row)
+        return sorted(rows, key=lambda r: -1.0 if r["psi"] is None else r["psi"], reverse=True)
+
+
+def drift_status(value, rows):
+    if value is None or rows < MIN_ROWS:
+        return "warming up"
+    if value >= PSI_MAJOR:
+        return "major"
+    if value >= PSI_MODERATE:
+        return "moderate"
+    return "stable"
+
+
+class DriftMonitor:
+    """Drift sketches for every diameter with a saved reference"""
+
+    def __init__(self, model_dir=MODEL_DIR, window_seconds=WINDOW_SECONDS, slots=WINDOW_SLOTS):
+        self.model_dir = model_dir
+        self.window_seconds = window_seconds
+        self.slots = slots
+        self._sketches = {}
+        self._lock = threading.Lock()
+
+    def sketch(self, diameter):
+        """The sketch for diameter, or None without a reference.
+
+        A retrained reference (new mtime) replaces the sketch, since counts
+        binned against the old edges no longer compare.
+        """
+        try:
+            diameter = int(float(diameter))
+            path = reference_path(self.model_dir, diameter)
+            mtime = os.stat(path).st_mtime_ns
+        except (OSError, TypeError, ValueError):
+            return None
+        entry = self._sketches.get(diameter)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        with self._lock:
+            entry = self._sketches.get(diameter)
+            if entry is None or entry[0] != mtime:
+                with open(path) as f:
+                    reference = json.load(f)
+                entry = self._sketches[diameter] = (mtime, DriftSketch(reference, self.window_seconds, self.slots))
+            return entry[1]
+
+    def observe_record(self, diameter, record):
+        """Add one {column: value} input row"""
+        sketch = self.sketch(diameter)
+        if sketch is None:
+            return
+        record = normalize_record(record)
+        x = np.array([_as_float(record.get(name)) for name in sketch.features])
+        sketch.observe(x)
+
+    def observe_frame(self, df, default_diameter=None):
+        """Add every row of a batch, routed by its DIAMETER column"""
+        df = normalize_columns(df)
+        if "DIAMETER" in df.columns:
+            diameters = pd.to_numeric(df["DIAMETER"], errors="coerce")
+            if default_diameter is not None:
+                # Same fallback as score_frame: blank cells use the default diameter
+                diameters = diameters.fillna(float(default_diameter))
+        elif default_diameter is not None:
+            diameters = pd.Series(default_diameter, index=df.index)
+        else:
+            return
+        for diameter, group in df.groupby(diameters):
+            sketch = self.sketch(diameter)
+            if sketch is not None:
+                sketch.observe(build_input_matrix(group, sketch.features))
+
+    def scores(self, diameter, now=None):
+        sketch = self.sketch(diameter)
+        return None if sketch is None else sketch.scores(now)
+
+    def info(self):
+        """Worst PSI and window rows per diameter, for the Prometheus gauges"""
+        values = {}
+        for diameter, (_, sketch) in list(self._sketches.items()):
+            rows = sketch.scores()
+            worst = rows[0]["psi"] if rows else None
+            values[f"d{diameter}_rows"] = rows[0]["rows"] if rows else 0
+            if worst is not None:
+                values[f"d{diameter}_psi_max"] = worst
+        return values
+
+
+def _as_float(value):
+    try:
+        return np.nan if value is None else float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def get_drift_monitor(model_dir=MODEL_DIR):
+    """The process-wide monitor for model_dir"""
+    model_dir = os.path.abspath(model_dir)
+    with _monitors_lock:
+        monitor = _monitors.get(model_dir)
+        if monitor is None:
+            monitor = _monitors[model_dir] = DriftMonitor(model_dir)
+        return monitor
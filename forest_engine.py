@@ -0,0 +1,171 @@
+"""Vectorized numpy inference engine for the quality forests.
+
+ForestEngine walks every tree for a whole batch at once: the state is
+one node index per (row, tree) pair, and each step advances all pairs
+that have not reached a leaf yet by one level. There is no DataFrame
+validation or joblib dispatch per call, which is what dominates
+RandomForestRegressor.predict for a single row.
+
+Set QUALITY_ENGINE=sklearn to serve pickled estimators unchanged.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model_format import pack_forest, read_forest
+
+# (row, tree) pairs walked per chunk; small enough to stay cache resident
+MAX_PAIRS_PER_CHUNK = 1 << 14
+# numpy releases the GIL while gathering, so chunks can run on threads
+ENGINE_THREADS = int(os.environ.get("QUALITY_ENGINE_THREADS", min(8, os.cpu_count() or 1)))
+
+_executor = None
+
+
+def engine_enabled():
+    return os.environ.get("QUALITY_ENGINE", "numpy").lower() != "sklearn"
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=ENGINE_THREADS, thread_name_prefix="forest-engine")
+    return _executor
+
+
+class ForestEngine:
+    """Packed forest that predicts like RandomForestRegressor"""
+
+    def __init__(self, arrays, meta):
+        self.meta = meta
+        self.roots = arrays["roots"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.value = arrays["value"]
+        self.missing_left = arrays["missing_left"]
+        self.n_trees = meta["n_trees"]
+        self.max_depth = meta["max_depth"]
+        self.n_features_in_ = meta["n_features"]
+        if meta.get("feature_names"):
+            self.feature_names_in_ = np.array(meta["feature_names"], dtype=object)
+
+    def _as_matrix(self, X):
+        if isinstance(X, pd.DataFrame):
+            names = getattr(self, "feature_names_in_", None)
+            if names is not None:
+                X = X.reindex(columns=list(names), fill_value=0)
+            X = X.to_numpy()
+        # sklearn evaluates trees on float32 inputs; match it exactly
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected {self.n_features_in_} features, got shape {X.shape}")
+        return X
+
+    def _apply_chunk(self, X):
+        n_rows = X.shape[0]
+        flat_x = X.ravel()
+        idx = np.tile(self.roots, n_rows)
+        row_offset = np.repeat(np.arange(n_rows, dtype=np.int64) * X.shape[1], self.n_trees)
+        has_nan = np.isnan(flat_x).any()
+
+        active = np.flatnonzero(self.left[idx] != idx)
+        while active.size:
+            node = idx[active]
+            x = flat_x[row_offset[active] + self.feature[node]]
+            go_left = x <= self.threshold[node]
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left[node].astype(bool)
+            nxt = np.where(go_left, self.left[node], self.right[node])
+            idx[active] = nxt
+            active = active[self.left[nxt] != nxt]
+        return idx.reshape(n_rows, self.n_trees)
+
+    def apply(self, X):
+        """Leaf node index of every row in every tree, shape (n_rows, n_trees)"""
+        X = self._as_matrix(X)
+        chunk = max(1, MAX_PAIRS_PER_CHUNK // self.n_trees)
+        if X.shape[0] <= chunk:
+            return self._apply_chunk(X)
+        chunks = [X[i:i + chunk] for i in range(0, X.shape[0], chunk)]
+        if ENGINE_THREADS > 1:
+            return np.vstack(list(_get_executor().map(self._apply_chunk, chunks)))
+        return np.vstack([self._apply_chunk(c) for c in chunks])
+
+    def predict_trees(self, X):
+        """Per-tree predictions, shape (n_rows, n_trees)"""
+        return self.value[self.apply(X)]
+
+    def predict(self, X):
+        return self.predict_trees(X).mean(axis=1)
+
+    def contributions(self, X):
+        """Tree-path (Saabas) attribution of each prediction to its features.
+
+        Walks the same (row, tree) state as apply(); every split taken
+        credits value[child] - value[parent] to the split feature. Returns
+        (bias, contrib) with bias + contrib.sum(axis=1) == predict(X).
+        """
+        X = self._as_matrix(X)
+        n_rows, n_features = X.shape
+        flat_x = X.ravel()
+        idx = np.tile(self.roots, n_rows)
+        pair_row = np.repeat(np.arange(n_rows, dtype=np.int64), self.n_trees)
+        row_offset = pair_row * n_features
+        has_nan = np.isnan(flat_x).any()
+        contrib = np.zeros(n_rows * n_features)
+
+        active = np.flatnonzero(self.left[idx] != idx)
+        while active.size:
+            node = idx[active]
+            split = self.feature[node]
+            x = flat_x[row_offset[active] + split]
+            go_left = x <= self.threshold[node]
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left[node].astype(bool)
+            nxt = np.where(go_left, self.left[node], self.right[node])
+            contrib += np.bincount(
+                row_offset[active] + split, weights=self.value[nxt] - self.value[node],
+                minlength=contrib.size,
+            )
+            idx[active] = nxt
+            active = active[self.left[nxt] != nxt]
+        bias = float(self.value[self.roots].mean())
+        return bias, contrib.reshape(n_rows, n_features) / self.n_trees
+
+
+def compile_forest(model):
+    """Compile a fitted RandomForestRegressor into a ForestEngine"""
+    arrays, meta = pack_forest(model)
+    return ForestEngine(arrays, meta)
+
+
+def load_forest(path, mmap=True):
+    """Open a .forest directory as a ForestEngine over memory-mapped buffers"""
+    arrays, meta = read_forest(path, mmap=mmap)
+    return ForestEngine(arrays, meta)
+
+
+def is_forest(model):
+    """True for fitted sklearn forests of single-output regression trees"""
+    estimators = getattr(model, "estimators_", None)
+    return (
+        bool(estimators)
+        and all(hasattr(est, "tree_") for est in estimators)
+        and getattr(model, "n_outputs_", 1) == 1
+    )
+
+
+def verify_equivalence(model, engine, X, rtol=1e-9, atol=1e-9):
+    """Check the engine reproduces model.predict on X; returns the max abs diff"""
+    expected = model.predict(X)
+    actual = engine.predict(X)
+    max_diff = float(np.max(np.abs(expected - actual))) if len(expected) else 0.0
+    if not np.allclose(expected, actual, rtol=rtol, atol=atol):
+        raise AssertionError(f"Forest engine diverges from model.predict (max diff {max_diff:g})")
+    return max_diff
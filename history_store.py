@@ -0,0 +1,318 @@
+"""Durable prediction log shared by every session of the app.
+
+Predictions are appended to a local SQLite database in WAL mode. The
+request path only enqueues the row. A background thread drains the
+queue and commits whatever has accumulated (up to BATCH_SIZE rows) in
+one transaction. Readers open their own connections, so WAL lets them
+page through the log while the writer commits.
+
+Pages use keyset pagination (WHERE id < last_seen ORDER BY id DESC),
+with indexes on timestamp, diameter, grade and session. Rendering a page
+costs the same for ten rows of history as for ten million. Exports walk
+the same keyset in chunks. "Clear History" only hides a session's rows;
+the log itself stays append-only.
+
+Single predictions from the app and from serve.py are appended one by
+one. Batch uploads and /predict_batch go through append_many: one row
+per scored (input row, target), handed to the writer as one queue item.
+
+The database lives at data/history.sqlite unless QUALITY_HISTORY_DB is set.
+"""
+import atexit
+import csv
+import io
+import json
+import os
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from model_registry import version_label
+from pipeline import interval_confidence
+from scoring import INPUT_COLS, model_key, normalize_grade, quality_threshold
+
+DEFAULT_PATH = os.environ.get(
+    "QUALITY_HISTORY_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "history.sqlite"),
+)
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 0.05
+EXPORT_CHUNK_ROWS = 50_000
+
+COLUMNS = [
+    "timestamp", "session_id", "diameter", "grade", "target", "prediction",
+    "std", "lower", "upper", "confidence", "meets", "model_version", "inputs",
+]
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    session_id TEXT,
+    diameter REAL,
+    grade TEXT,
+    target TEXT,
+    prediction REAL,
+    std REAL,
+    lower REAL,
+    upper REAL,
+    confidence REAL,
+    meets INTEGER,
+    model_version TEXT,
+    inputs TEXT,
+    hidden INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions(timestamp);
+CREATE INDEX IF NOT EXISTS idx_predictions_diameter ON predictions(diameter);
+CREATE INDEX IF NOT EXISTS idx_predictions_grade ON predictions(grade);
+CREATE INDEX IF NOT EXISTS idx_predictions_session ON predictions(session_id);
+"""
+
+_STOP = object()
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class HistoryStore:
+    """Append-only prediction log with a batched background writer"""
+
+    def __init__(self, path=DEFAULT_PATH, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # Logs created before a column existed get it added in place
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(predictions)")}
+            for column in COLUMNS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE predictions ADD COLUMN {column}")
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self.written = 0
+        self.batches = 0
+        self._writer = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: commits survive an app crash; only an OS crash can lose the last batch
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        # sqlite3 connections are per thread; Streamlit runs each session on its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # --- WRITES ---
+    @staticmethod
+    def _row(entry):
+        row = dict(entry)
+        if isinstance(row.get("inputs"), dict):
+            row["inputs"] = json.dumps(row["inputs"])
+        if row.get("meets") is not None:
+            row["meets"] = int(bool(row["meets"]))
+        return tuple(row.get(c) for c in COLUMNS)
+
+    def append(self, entry):
+        """Queue one prediction (a dict with COLUMNS keys) for the background writer"""
+        self._queue.put(("insert", self._row(entry)))
+
+    def append_many(self, entries):
+        """Queue a batch of predictions as a single item; the writer thread serializes them"""
+        entries = list(entries)
+        if entries:
+            self._queue.put(("insert_many", entries))
+
+    def hide_session(self, session_id):
+        """Hide a session's rows from its own history view (rows are kept)"""
+        self._queue.put(("hide", session_id))
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far is committed; False on timeout"""
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(timeout=10)
+
+    def _run(self):
+        conn = self._connect()
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            # Whatever else arrives within flush_interval rides along in the same commit
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stop = True
+                batch = [op for op in batch if op is not _STOP]
+            try:
+                self._write(conn, batch)
+            except sqlite3.Error as e:
+                print(f"❌ History write failed ({len(batch)} ops): {e}")
+            for op, arg in batch:
+                if op == "flush":
+                    arg.set()
+        conn.close()
+
+    def _write(self, conn, batch):
+        rows = []
+        with conn:
+            for op, arg in batch:
+                if op == "insert":
+                    rows.append(arg)
+                    continue
+                if op == "insert_many":
+                    rows.extend(self._row(entry) for entry in arg)
+                    continue
+                # Keep ordering: commit pending inserts before a hide
+                self._insert(conn, rows)
+                rows = []
+                if op == "hide":
+                    conn.execute("UPDATE predictions SET hidden = 1 WHERE session_id = ? AND hidden = 0", (arg,))
+            self._insert(conn, rows)
+
+    def _insert(self, conn, rows):
+        if rows:
+            conn.executemany(
+                f"INSERT INTO predictions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows
+            )
+            self.written += len(rows)
+            self.batches += 1
+
+    # --- READS ---
+    @staticmethod
+    def _where(session_id=None, diameter=None, grade=None, target=None, since=None, until=None,
+               include_hidden=False, before_id=None):
+        clauses, params = [], []
+        for column, value in (("session_id", session_id), ("diameter", diameter),
+                              ("grade", grade), ("target", target)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if not include_hidden:
+            clauses.append("hidden = 0")
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def page(self, limit=25, before_id=None, **filters):
+        """Newest-first page of rows older than before_id; returns (DataFrame, next before_id)"""
+        where, params = self._where(before_id=before_id, **filters)
+        df = pd.read_sql_query(
+            f"SELECT id, {', '.join(COLUMNS)} FROM predictions{where} ORDER BY id DESC LIMIT ?",
+            self._reader(), params=params + [limit],
+        )
+        next_id = int(df["id"].iloc[-1]) if len(df) == limit else None
+        return df, next_id
+
+    def iter_csv(self, chunk_rows=EXPORT_CHUNK_ROWS, **filters):
+        """CSV text of every matching row, newest first, one keyset chunk at a time"""
+        where, params = self._where(**filters)
+        before_id = None
+        header = True
+        while True:
+            chunk_where, chunk_params = where, list(params)
+            if before_id is not None:
+                chunk_where += (" AND " if chunk_where else " WHERE ") + "id < ?"
+                chunk_params.append(before_id)
+            cursor = self._reader().execute(
+                f"SELECT id, {', '.join(COLUMNS)} FROM predictions{chunk_where} ORDER BY id DESC LIMIT ?",
+                chunk_params + [chunk_rows],
+            )
+            rows = cursor.fetchall()
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if header:
+                writer.writerow(["id"] + COLUMNS)
+                header = False
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            if len(rows) < chunk_rows:
+                return
+            before_id = rows[-1][0]
+
+    def export_csv(self, **filters):
+        """Full CSV export as bytes (built only when called)"""
+        return "".join(self.iter_csv(**filters)).encode("utf-8")
+
+    def info(self):
+        return {"queued": self._queue.qsize(), "written": self.written, "batches": self.batches}
+
+
+def frame_entries(result, session_id, targets, timestamp=None):
+    """History rows for a score_frame result: one per (input row, target) that was scored"""
+    timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    versions = result.attrs.get("model_versions", {})
+    input_cols = [c for c in INPUT_COLS if c in result.columns]
+    inputs = result[input_cols].apply(pd.to_numeric, errors="coerce").astype(object)
+    inputs = inputs.where(inputs.notna(), None).to_dict(orient="records")
+    diameters = pd.to_numeric(result["DIAMETER"], errors="coerce").to_numpy()
+    if "GRADE" in result.columns:
+        grades = [normalize_grade(g) if pd.notna(g) else None for g in result["GRADE"]]
+    else:
+        grades = [None] * len(result)
+    entries = []
+    for target in targets:
+        if f"{target}_PRED" not in result.columns:
+            continue
+        pred = result[f"{target}_PRED"].to_numpy(dtype=np.float64)
+        bands = [result[f"{target}{suffix}"].to_numpy(dtype=np.float64) if f"{target}{suffix}" in result.columns
+                 else np.full(len(result), np.nan) for suffix in ("_STD", "_P05", "_P95")]
+        std, lower, upper = (np.where(np.isnan(band), None, band).tolist() for band in bands)
+        confidence = interval_confidence(pred, bands[1], bands[2])
+        confidence = np.where(np.isnan(confidence), None, confidence).tolist()
+        thresholds = {}
+        for i in np.flatnonzero(~np.isnan(pred)):
+            grade = grades[i]
+            if grade not in thresholds:
+                thresholds[grade] = quality_threshold(target, grade)
+            entries.append({
+                "timestamp": timestamp,
+                "session_id": session_id,
+                "diameter": float(diameters[i]),
+                "grade": grade,
+                "target": target,
+                "prediction": float(pred[i]),
+                "std": std[i],
+                "lower": lower[i],
+                "upper": upper[i],
+                "confidence": confidence[i],
+                "meets": pred[i] >= thresholds[grade],
+                "model_version": version_label(versions.get(model_key(target, diameters[i]))),
+                "inputs": inputs[i],
+            })
+    return entries
+
+
+def get_history_store(path=DEFAULT_PATH):
+    """The process-wide store for path"""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = HistoryStore(path)
+        return store
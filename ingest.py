@@ -0,0 +1,184 @@
+"""Columnar cache for the Diameter_*.xlsx sources.
+
+Each workbook is converted once into a Parquet file under data/.cache/
+and re-read from there on later runs. A small manifest next to the
+cache records the source size, mtime and SHA-256; the workbook is only
+re-parsed when its content actually changed. Conversion streams the
+sheet in row chunks through openpyxl's read-only mode, so workbooks
+larger than memory can be converted.
+
+    python ingest.py                  # refresh every data/Diameter_*.xlsx
+    python ingest.py data/Diameter_10.xlsx --force
+"""
+import argparse
+import datetime as dt
+import glob
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+CACHE_VERSION = 1
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+CACHE_DIR = os.path.join(DATA_DIR, ".cache")
+CHUNK_ROWS = 50_000
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_paths(source, cache_dir=CACHE_DIR):
+    """(parquet path, manifest path) for a source workbook"""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(cache_dir, f"{stem}.parquet"), os.path.join(cache_dir, f"{stem}.json")
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _infer_schema(header, rows):
+    """float64 for columns that are purely numeric in the first chunk, else string"""
+    fields = []
+    for i, name in enumerate(header):
+        values = [row[i] for row in rows if row[i] is not None]
+        numeric = bool(values) and all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in values
+        )
+        fields.append(pa.field(name, pa.float64() if numeric else pa.string()))
+    return pa.schema(fields)
+
+
+def _to_text(value):
+    if value is None:
+        return None
+    if isinstance(value, (dt.datetime, dt.date)):
+        return value.isoformat(sep=" ") if isinstance(value, dt.datetime) else value.isoformat()
+    return str(value)
+
+
+def _chunk_table(header, rows, schema):
+    columns = {}
+    for i, field in enumerate(schema):
+        values = [row[i] if i < len(row) else None for row in rows]
+        if pa.types.is_floating(field.type):
+            columns[field.name] = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(float)
+        else:
+            columns[field.name] = [_to_text(v) for v in values]
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+def convert_workbook(source, dest, chunk_rows=CHUNK_ROWS):
+    """Stream the first sheet of source into a Parquet file; returns the row count"""
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows_iter = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows_iter, None)
+        if header is None:
+            raise ValueError(f"{source} is empty")
+        header = [str(h).strip() if h is not None else f"COLUMN_{i}" for i, h in enumerate(header)]
+
+        tmp_path = dest + ".tmp"
+        writer = None
+        schema = None
+        n_rows = 0
+        chunk = []
+        try:
+            for row in rows_iter:
+                if all(v is None for v in row):
+                    continue
+                chunk.append(row)
+                if len(chunk) >= chunk_rows:
+                    schema = schema or _infer_schema(header, chunk)
+                    writer = writer or pq.ParquetWriter(tmp_path, schema)
+                    writer.write_table(_chunk_table(header, chunk, schema))
+                    n_rows += len(chunk)
+                    chunk = []
+            if chunk or writer is None:
+                schema = schema or _infer_schema(header, chunk)
+                writer = writer or pq.ParquetWriter(tmp_path, schema)
+                writer.write_table(_chunk_table(header, chunk, schema))
+                n_rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        os.replace(tmp_path, dest)
+        return n_rows
+    finally:
+        workbook.close()
+
+
+def ensure_cache(source, cache_dir=CACHE_DIR, force=False):
+    """Return the Parquet cache for source, converting only if the source changed"""
+    os.makedirs(cache_dir, exist_ok=True)
+    dest, manifest_path = cache_paths(source, cache_dir)
+    stat = os.stat(source)
+    manifest = _read_manifest(manifest_path)
+
+    if not force and manifest and os.path.exists(dest) and manifest.get("version") == CACHE_VERSION:
+        if manifest["size"] == stat.st_size and manifest["mtime_ns"] == stat.st_mtime_ns:
+            return dest
+        # Touched but possibly unchanged: fall back to the content hash
+        sha256 = file_sha256(source)
+        if sha256 == manifest["sha256"]:
+            manifest.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            _write_manifest(manifest_path, manifest)
+            return dest
+    else:
+        sha256 = file_sha256(source)
+
+    print(f"📦 Converting {os.path.basename(source)} to columnar cache...")
+    start = time.perf_counter()
+    n_rows = convert_workbook(source, dest)
+    _write_manifest(manifest_path, {
+        "version": CACHE_VERSION,
+        "source": os.path.abspath(source),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256,
+        "rows": n_rows,
+    })
+    print(f"✅ Cached {n_rows} rows in {time.perf_counter() - start:.1f}s")
+    return dest
+
+
+def load_table(source, columns=None, cache_dir=CACHE_DIR):
+    """Read a source workbook through its columnar cache"""
+    return pd.read_parquet(ensure_cache(source, cache_dir), columns=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Diameter_*.xlsx sources into the columnar cache")
+    parser.add_argument("sources", nargs="*", help="Workbooks to convert (default: data/Diameter_*.xlsx)")
+    parser.add_argument("--force", action="store_true", help="Reconvert even if the cache is fresh")
+    args = parser.parse_args()
+
+    sources = args.sources or sorted(glob.glob(os.path.join(DATA_DIR, "Diameter_*.xlsx")))
+    for source in sources:
+        dest = ensure_cache(source, force=args.force)
+        print(f"📄 {os.path.basename(source)} -> {os.path.relpath(dest)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Timing spans and cache gauges for the prediction hot path.
+
+Code wraps a step in ``with get_metrics().span("predict"):``. Every
+span feeds one histogram that keeps two views:
+
+- cumulative Prometheus buckets, sum and count, which never reset;
+- a rolling window: a ring of per-slot bucket counts, so p50/p95/p99
+  over the last few minutes cost O(1) per observation.
+
+render_prometheus() returns the text exposition format. serve.py serves
+it at GET /metrics, and the app writes it to QUALITY_METRICS_FILE after
+every rerun when that variable is set. Gauge callbacks (model cache,
+prediction cache) are sampled only at render time.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Upper bounds in seconds, from 0.1 ms single-row predicts to multi-second batch jobs
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+WINDOW_SECONDS = float(os.environ.get("QUALITY_METRICS_WINDOW", 300))
+WINDOW_SLOTS = 10
+PREFIX = "quality"
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+class SlotRing:
+    """Rolling window of numpy counters: one block per time slot, recycled once a full window old.
+
+    counts has shape (slots, *shape); sums holds one float per slot. Both
+    are only touched through add() and window(), so memory stays fixed
+    however much traffic flows through.
+    """
+
+    def __init__(self, shape, window_seconds, slots):
+        self.slot_seconds = window_seconds / slots
+        self.counts = np.zeros((slots, *shape), dtype=np.int64)
+        self.sums = np.zeros(slots)
+        self.epochs = np.full(slots, -1, dtype=np.int64)
+
+    def _slot(self, now):
+        epoch = int(now // self.slot_seconds)
+        slot = epoch % len(self.counts)
+        if self.epochs[slot] != epoch:
+            # Slot last used a full window ago: recycle it
+            self.counts[slot] = 0
+            self.sums[slot] = 0.0
+            self.epochs[slot] = epoch
+        return slot
+
+    def add(self, index, count=1, value=0.0, now=None):
+        """Add count to the current slot's cells at index (... for the whole block) and value to its sum"""
+        slot = self._slot(time.monotonic() if now is None else now)
+        self.counts[slot][index] += count
+        self.sums[slot] += value
+
+    def window(self, now=None):
+        """(counts, sum) over the slots still inside the window"""
+        now = time.monotonic() if now is None else now
+        live = self.epochs > int(now // self.slot_seconds) - len(self.counts)
+        return self.counts[live].sum(axis=0), float(self.sums[live].sum())
+
+
+class Histogram:
+    """Cumulative bucket counts plus a rolling window of per-slot counts"""
+
+    def __init__(self, buckets=BUCKETS, window_seconds=WINDOW_SECONDS, slots=WINDOW_SLOTS):
+        self.bounds = np.array(buckets)
+        self.counts = np.zeros(len(buckets) + 1, dtype=np.int64)
+        self.sum = 0.0
+        self.count = 0
+        self.ring = SlotRing((len(buckets) + 1,), window_seconds, slots)
+
+    def observe(self, seconds, now=None):
+        i = int(np.searchsorted(self.bounds, seconds))
+        self.counts[i] += 1
+        self.sum += seconds
+        self.count += 1
+        self.ring.add(i, value=seconds, now=now)
+
+    def window(self, now=None):
+        """(bucket counts, sum) over the slots still inside the window"""
+        return self.ring.window(now)
+
+    def quantile(self, q, counts):
+        """Quantile estimate by linear interpolation inside the bucket that holds it"""
+        total = counts.sum()
+        if total == 0:
+            return None
+        rank = q * total
+        cumulative = np.cumsum(counts)
+        i = int(np.searchsorted(cumulative, rank))
+        if i >= len(self.bounds):
+            return float(self.bounds[-1])
+        lower = self.bounds[i - 1] if i > 0 else 0.0
+        before = cumulative[i - 1] if i > 0 else 0
+        fraction = (rank - before) / counts[i] if counts[i] else 1.0
+        return float(lower + (self.bounds[i] - lower) * fraction)
+
+
+class MetricsRegistry:
+    """Named span histograms and gauge callbacks shared by the whole process"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block into the histogram for name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def register_gauges(self, name, fn):
+        """fn() -> {metric: number}, sampled on every render"""
+        self._gauges[name] = fn
+
+    def snapshot(self):
+        """Rolling-window summary per span for the debug panel"""
+        rows = []
+        with self._lock:
+            for name, h in sorted(self._histograms.items()):
+                counts, total = h.window()
+                n = int(counts.sum())
+                rows.append({
+                    "span": name,
+                    "count": h.count,
+                    "recent": n,
+                    "mean_ms": total / n * 1000 if n else None,
+                    "p50_ms": _ms(h.quantile(0.50, counts)),
+                    "p95_ms": _ms(h.quantile(0.95, counts)),
+                    "p99_ms": _ms(h.quantile(0.99, counts)),
+                })
+        return rows
+
+    def gauges(self):
+        values = {}
+        for name, fn in list(self._gauges.items()):
+            try:
+                sample = fn()
+            except Exception:
+                continue
+            for key, value in sample.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values[f"{PREFIX}_{name}_{key}"] = value
+        return values
+
+    def render_prometheus(self):
+        """All spans and gauges in the Prometheus text exposition format"""
+        metric = f"{PREFIX}_span_seconds"
+        lines = [
+            f"# HELP {metric} Wall time of instrumented steps in the prediction flow",
+            f"# TYPE {metric} histogram",
+        ]
+        with self._lock:
+            for name, h in sorted(self._histograms.items()):
+                cumulative = np.cumsum(h.counts)
+                for bound, count in zip(h.bounds, cumulative):
+                    lines.append(f'{metric}_bucket{{span="{name}",le="{bound:g}"}} {count}')
+                lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {h.count}')
+                lines.append(f'{metric}_sum{{span="{name}"}} {h.sum:.9g}')
+                lines.append(f'{metric}_count{{span="{name}"}} {h.count}')
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:.9g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Atomically replace path with the current exposition (for file-based scrapers)"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def get_metrics():
+    """The process-wide metrics registry"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = MetricsRegistry()
+        return _metrics
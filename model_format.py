@@ -0,0 +1,112 @@
+"""Packed, memory-mappable forest artifacts.
+
+A fitted RandomForestRegressor is flattened into one directory of .npy
+buffers plus a small meta.json:
+
+    models/quality1_d10.forest/
+        meta.json      feature names, tree count, depth, preprocessing
+        roots.npy      first node of every tree (global node index)
+        left.npy       left child per node (leaves point at themselves)
+        right.npy      right child per node (leaves point at themselves)
+        feature.npy    split feature per node (0 for leaves)
+        threshold.npy  split threshold per node
+        value.npy      mean target value per node
+        missing_left.npy  whether NaN goes left at each split
+
+The buffers are opened with np.load(mmap_mode="r"), so every worker
+process maps the same page-cached file instead of unpickling its own
+copy of the object graph. forest_engine.ForestEngine evaluates them.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+FORMAT_VERSION = 1
+FOREST_SUFFIX = ".forest"
+ARRAY_NAMES = ["roots", "left", "right", "feature", "threshold", "value", "missing_left"]
+
+
+def pack_forest(model):
+    """Flatten the trees of a fitted forest into concatenated node arrays"""
+    trees = [est.tree_ for est in model.estimators_]
+    sizes = np.array([t.node_count for t in trees], dtype=np.int64)
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+
+    left, right, feature, threshold, value, missing_left = [], [], [], [], [], []
+    for root, t in zip(roots, trees):
+        own = np.arange(t.node_count, dtype=np.int64)
+        is_leaf = t.children_left == -1
+        left.append(root + np.where(is_leaf, own, t.children_left))
+        right.append(root + np.where(is_leaf, own, t.children_right))
+        feature.append(np.where(is_leaf, 0, t.feature).astype(np.int32))
+        threshold.append(np.where(is_leaf, 0.0, t.threshold))
+        value.append(t.value[:, 0, 0].astype(np.float64))
+        mgl = getattr(t, "missing_go_to_left", None)
+        missing_left.append(np.zeros(t.node_count, np.uint8) if mgl is None else np.asarray(mgl, np.uint8))
+
+    arrays = {
+        "roots": roots,
+        "left": np.concatenate(left),
+        "right": np.concatenate(right),
+        "feature": np.concatenate(feature),
+        "threshold": np.concatenate(threshold),
+        "value": np.concatenate(value),
+        "missing_left": np.concatenate(missing_left),
+    }
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "n_trees": len(trees),
+        "n_nodes": int(sizes.sum()),
+        "max_depth": int(max(t.max_depth for t in trees)),
+        "n_features": int(model.n_features_in_),
+        "feature_names": [str(c) for c in getattr(model, "feature_names_in_", [])],
+    }
+    return arrays, meta
+
+
+def export_forest(model, path, extra_meta=None):
+    """Write a fitted forest as a packed .forest directory (replacing any old one)"""
+    arrays, meta = pack_forest(model)
+    meta.update(extra_meta or {})
+    return write_forest(arrays, meta, path)
+
+
+def replace_dir(source, dest):
+    """Move directory source to dest, swapping any existing dest aside first.
+
+    A directory cannot be replaced in one rename, so there is a brief
+    window where dest does not exist; it never holds a half-written or
+    half-deleted artifact.
+    """
+    old = dest + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(dest):
+        os.replace(dest, old)
+    os.replace(source, dest)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def write_forest(arrays, meta, path):
+    """Write packed node arrays and meta as a .forest directory (replacing any old one)"""
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(arr))
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    replace_dir(tmp_path, path)
+    return path
+
+
+def read_forest(path, mmap=True):
+    """Open a .forest directory; arrays are memory-mapped unless mmap=False"""
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported forest format: {meta.get('format_version')}")
+    mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in ARRAY_NAMES}
+    return arrays, meta
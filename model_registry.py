@@ -0,0 +1,349 @@
+"""Process-wide model registry.
+
+Every Streamlit session and server thread shares one registry per model
+directory, so each artifact is loaded once per process no matter how
+many operators are connected. Packed .forest directories are preferred
+over pickles because they are memory-mapped and shared between
+processes through the page cache.
+
+start_watcher() polls the artifacts of resident models in a background
+thread. A changed artifact is loaded and smoke-tested off the request
+path, then swapped in under the registry lock, so a prediction sees
+either the old model or the new one, never a half-loaded one. The old
+copy is released as soon as in-flight calls drop their reference.
+Without a watcher, __getitem__ checks the artifact on every access.
+"""
+import glob
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from collections.abc import Mapping
+from types import MappingProxyType
+
+import numpy as np
+
+from forest_engine import engine_enabled
+from metrics import get_metrics
+from model_format import FOREST_SUFFIX
+from pipeline import compile_model, load_packed_pipeline
+from scoring import MODEL_DIR
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def estimate_nbytes(obj, _seen=None):
+    """Rough in-memory size of a fitted model, counting its numpy buffers"""
+    if _seen is None:
+        _seen = {}
+    if id(obj) in _seen:
+        return 0
+    # Keep a reference so temporary __getstate__ dicts cannot recycle ids
+    _seen[id(obj)] = obj
+
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sum(estimate_nbytes(v, _seen) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_nbytes(v, _seen) for v in obj)
+    # sklearn's Cython Tree exposes its node arrays only through __getstate__
+    if type(obj).__name__ == "Tree" and hasattr(obj, "__getstate__"):
+        return estimate_nbytes(obj.__getstate__(), _seen)
+    if hasattr(obj, "__dict__"):
+        return estimate_nbytes(vars(obj), _seen)
+    return 0
+
+
+def _artifact_bytes(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def version_label(version):
+    """Short display ID of an artifact version: its modification time, e.g. 20261018-151900"""
+    if version is None:
+        return None
+    mtime_ns = int(version.split("-", 1)[0], 16)
+    return datetime.fromtimestamp(mtime_ns / 1e9).strftime("%Y%m%d-%H%M%S")
+
+
+def smoke_predict(model):
+    """Raise unless model returns one finite prediction for an all-missing input row"""
+    n_features = getattr(model, "n_features_in_", None)
+    if n_features is None:
+        raise ValueError("model does not declare its input width")
+    prediction = np.asarray(model.predict(np.full((1, n_features), np.nan)), dtype=np.float64)
+    if prediction.shape != (1,) or not np.isfinite(prediction).all():
+        raise ValueError(f"smoke prediction returned {prediction!r}")
+
+
+def artifact_version(path):
+    """Cheap on-disk signature of an artifact (mtime + size), or None if missing"""
+    if os.path.isdir(path):
+        path = os.path.join(path, "meta.json")
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+class ModelRegistry(Mapping):
+    """Lazily loaded, LRU-bounded view of models/*.forest and models/*.pkl.
+
+    Models are unpickled on first access and the least recently used ones
+    are evicted once either budget (model count or estimated bytes) is
+    exceeded. Budgets default to the MODEL_CACHE_MAX_MODELS and
+    MODEL_CACHE_MAX_MB environment variables; 0 means unlimited.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, max_models=None, max_bytes=None):
+        self.model_dir = model_dir
+        if max_models is None:
+            max_models = int(os.environ.get("MODEL_CACHE_MAX_MODELS", 0))
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("MODEL_CACHE_MAX_MB", 0)) * 1e6)
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self._models = OrderedDict()
+        self._stats = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+        self.load_seconds_total = 0.0
+        self.reloads = 0
+        self.rejected = {}
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        # Read-only views handed out to sessions
+        self.models = MappingProxyType(self._models)
+        self.stats = MappingProxyType(self._stats)
+
+    def discover(self):
+        """Model keys available on disk (artifact name without extension)"""
+        paths = glob.glob(os.path.join(self.model_dir, "*.pkl"))
+        paths += glob.glob(os.path.join(self.model_dir, f"*{FOREST_SUFFIX}"))
+        return sorted({os.path.splitext(os.path.basename(p))[0] for p in paths})
+
+    def available_diameters(self):
+        """Diameters that have at least one model on disk"""
+        diameters = set()
+        for key in self.discover():
+            _, _, suffix = key.rpartition("_d")
+            if suffix.isdigit():
+                diameters.add(int(suffix))
+        return sorted(diameters)
+
+    def _path(self, key):
+        packed_path = os.path.join(self.model_dir, f"{key}{FOREST_SUFFIX}")
+        pickle_path = os.path.join(self.model_dir, f"{key}.pkl")
+        # QUALITY_ENGINE=sklearn serves the pickled estimator when there is one
+        if os.path.isdir(packed_path) and (engine_enabled() or not os.path.exists(pickle_path)):
+            return packed_path
+        if engine_enabled() and os.path.isdir(packed_path + ".old"):
+            # Mid model_format.replace_dir: report the forest as missing rather than fall back to the pickle
+            return packed_path
+        return pickle_path
+
+    def __getitem__(self, key):
+        with self._lock:
+            model = self._models.get(key)
+            # As in check_for_updates, a missing (mid-replace) artifact keeps the resident copy
+            if (model is not None and not self.watching
+                    and artifact_version(self._path(key)) not in (None, self._stats[key]["version"])):
+                # The artifact changed on disk; drop the stale copy and reload
+                print(f"🔄 Model changed on disk: {key}")
+                del self._models[key]
+                model = None
+            if model is not None:
+                self.hits += 1
+                self._models.move_to_end(key)
+                return model
+            self.misses += 1
+            if not os.path.exists(self._path(key)):
+                raise KeyError(key)
+            model = self._load(key)
+            if model is None:
+                raise KeyError(key)
+            self._evict()
+            return model
+
+    def __iter__(self):
+        return iter(self.discover())
+
+    def __len__(self):
+        return len(self.discover())
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def load_all(self):
+        """Warm the cache with every discovered model (within budget)"""
+        for key in self.discover():
+            self.get(key)
+        return self.models
+
+    def _read(self, key):
+        """Load key from disk without touching the cache; returns (model, stats)"""
+        model_path = self._path(key)
+        # Taken before reading so a write during the load is seen as a change
+        version = artifact_version(model_path)
+        start = time.perf_counter()
+        if model_path.endswith(FOREST_SUFFIX):
+            model = load_packed_pipeline(model_path)
+        else:
+            with open(model_path, "rb") as f:
+                model = pickle.load(f)
+            if engine_enabled():
+                model = compile_model(model)
+        load_seconds = time.perf_counter() - start
+        get_metrics().observe("model_load", load_seconds)
+        return model, {
+            "path": model_path,
+            "version": version,
+            "version_id": version_label(version),
+            "load_seconds": load_seconds,
+            "nbytes": estimate_nbytes(model),
+            "file_bytes": _artifact_bytes(model_path),
+        }
+
+    def _load(self, key):
+        try:
+            model, stats = self._read(key)
+        except Exception as e:
+            print(f"❌ Error loading {os.path.basename(self._path(key))}: {str(e)}")
+            return None
+        self.loads += 1
+        self.load_seconds_total += stats["load_seconds"]
+        self._models[key] = model
+        self._stats[key] = stats
+        print(f"✅ Loaded model: {key} ({stats['load_seconds'] * 1000:.0f} ms)")
+        return model
+
+    # --- HOT RELOAD ---
+    @property
+    def watching(self):
+        return self._watcher is not None and self._watcher.is_alive()
+
+    def start_watcher(self, interval=None):
+        """Poll resident models' artifacts every interval seconds and hot-swap changes"""
+        if interval is None:
+            interval = float(os.environ.get("MODEL_WATCH_INTERVAL", 2.0))
+        with self._lock:
+            if self.watching or interval <= 0:
+                return
+            self._stop_watching.clear()
+            self._watcher = threading.Thread(
+                target=self._watch, args=(interval,), name="model-watcher", daemon=True
+            )
+            self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+
+    def _watch(self, interval):
+        while not self._stop_watching.wait(interval):
+            try:
+                self.check_for_updates()
+            except Exception as e:
+                print(f"❌ Model watcher error: {e}")
+
+    def check_for_updates(self):
+        """Reload every resident model whose artifact changed; returns the swapped keys"""
+        swapped = []
+        for key in list(self._models):
+            version = artifact_version(self._path(key))
+            stats = self._stats.get(key)
+            # Missing (mid-replace) or already rejected versions are left alone until they change again
+            if version is None or stats is None or version == stats["version"] or self.rejected.get(key) == version:
+                continue
+            if self.reload(key):
+                swapped.append(key)
+        return swapped
+
+    def reload(self, key):
+        """Load and validate key's current artifact, then swap it in atomically"""
+        start = time.perf_counter()
+        try:
+            model, stats = self._read(key)
+            smoke_predict(model)
+        except Exception as e:
+            self.rejected[key] = artifact_version(self._path(key))
+            print(f"❌ Rejected new artifact for {key}: {e}")
+            return False
+        with self._lock:
+            if key not in self._models:
+                # Evicted while loading: the next access will load the new version lazily
+                return False
+            old_id = self._stats[key].get("version_id")
+            self._models[key] = model
+            self._stats[key] = stats
+            self.reloads += 1
+        self.rejected.pop(key, None)
+        get_metrics().observe("model_reload", time.perf_counter() - start)
+        print(f"🔄 Hot-swapped {key}: {old_id} → {stats['version_id']}")
+        return True
+
+    def _evict(self):
+        # Never evict the model that was just loaded (the last entry)
+        while len(self._models) > 1 and (
+            (self.max_models and len(self._models) > self.max_models)
+            or (self.max_bytes and self.total_nbytes() > self.max_bytes)
+        ):
+            key, _ = self._models.popitem(last=False)
+            self.evictions += 1
+            print(f"♻️ Evicted model: {key}")
+
+    def get_with_version(self, key):
+        """(model, version) read atomically; (None, None) if key is unavailable"""
+        with self._lock:
+            model = self.get(key)
+            return model, self.version(key)
+
+    def version(self, key):
+        """Version of the resident copy of key (None if it is not loaded)"""
+        stats = self._stats.get(key)
+        return stats["version"] if stats and key in self._models else None
+
+    def version_id(self, key):
+        """Display ID of the resident copy of key (None if it is not loaded)"""
+        stats = self._stats.get(key)
+        return stats["version_id"] if stats and key in self._models else None
+
+    def total_nbytes(self):
+        """Estimated bytes held by the resident models"""
+        return sum(self._stats[key]["nbytes"] for key in self._models)
+
+    def cache_info(self):
+        """Counters for the sidebar status block"""
+        return {
+            "resident": len(self._models),
+            "available": len(self.discover()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "nbytes": self.total_nbytes(),
+            "avg_load_ms": 1000 * self.load_seconds_total / self.loads if self.loads else 0.0,
+            "reloads": self.reloads,
+            "rejected": len(self.rejected),
+        }
+
+
+def get_registry(model_dir=MODEL_DIR):
+    """Return the shared registry for model_dir"""
+    model_dir = os.path.abspath(model_dir)
+    with _REGISTRIES_LOCK:
+        registry = _REGISTRIES.get(model_dir)
+        if registry is None:
+            registry = ModelRegistry(model_dir)
+            _REGISTRIES[model_dir] = registry
+    return registry
@@ -0,0 +1,124 @@
+"""Inverse search for process settings that meet the quality targets.
+
+Chemistry and grade stay fixed; TEMP1-6, SPEED and PROCESS1-3 are
+searched jointly against every target model of one diameter. The search
+is a cross-entropy method: each generation samples a population of
+settings, scores it with one batched predict per model, and refits a
+per-column Gaussian to the best candidates. It stops at the time budget
+or when the sampling distribution has collapsed.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from scoring import PROCESS_COLS, TEMP_COLS, quality_threshold
+
+SEARCH_COLS = TEMP_COLS + ["SPEED"] + PROCESS_COLS
+
+
+def search_bounds(models, columns=SEARCH_COLS, n_std=2.0):
+    """Per-column (low, high) covering every model's training mean +/- n_std std"""
+    bounds = {}
+    for col in columns:
+        lows, highs = [], []
+        for model in models.values():
+            i = model.column_index[col]
+            lows.append(model.means[i] - n_std * model.scales[i])
+            highs.append(model.means[i] + n_std * model.scales[i])
+        bounds[col] = (max(0.0, min(lows)), max(highs))
+    return bounds
+
+
+def evaluate(models, base_record, columns, settings):
+    """Predictions of every model for an (n, len(columns)) block of settings"""
+    predictions = {}
+    for target, model in models.items():
+        X = np.repeat(model.vector_from_record(base_record), len(settings), axis=0)
+        X[:, [model.column_index[c] for c in columns]] = settings
+        predictions[target] = model.predict(X)
+    return predictions
+
+
+def score_candidates(predictions, thresholds):
+    """(shortfall, margin): total deficit below thresholds and the worst-case headroom"""
+    shortfall = 0.0
+    margin = None
+    for target, threshold in thresholds.items():
+        gap = predictions[target] - threshold
+        shortfall = shortfall + np.maximum(0.0, -gap)
+        margin = gap if margin is None else np.minimum(margin, gap)
+    return shortfall, margin
+
+
+def optimize_process(models, base_record, thresholds=None, bounds=None, time_budget=2.0,
+                     population=512, elite_frac=0.1, top_k=10, seed=0):
+    """Search for settings predicted to meet thresholds; returns (candidates, info).
+
+    models maps target -> pipeline for one diameter. thresholds defaults
+    to the grade standards of base_record's GRADE. Candidates are ranked
+    by shortfall (0 = meets every threshold), then by the smallest margin
+    over all targets, largest first.
+    """
+    if thresholds is None:
+        thresholds = {t: quality_threshold(t, base_record.get("GRADE")) for t in models}
+    bounds = bounds or search_bounds(models)
+    columns = list(bounds)
+    low = np.array([bounds[c][0] for c in columns])
+    high = np.array([bounds[c][1] for c in columns])
+    width = np.where(high > low, high - low, 1.0)
+    rng = np.random.default_rng(seed)
+    n_elite = max(2, int(population * elite_frac))
+
+    # First generation: uniform over the box, plus the current settings
+    settings = rng.uniform(low, high, size=(population, len(columns)))
+    current = [base_record.get(c) for c in columns]
+    if all(v is not None for v in current):
+        settings[0] = np.clip(np.asarray(current, dtype=np.float64), low, high)
+
+    start = time.perf_counter()
+    archive_x, archive_p = [], []
+    evaluations = generations = 0
+    while True:
+        predictions = evaluate(models, base_record, columns, settings)
+        shortfall, margin = score_candidates(predictions, thresholds)
+        evaluations += len(settings)
+        generations += 1
+
+        # Lexicographic ranking: no shortfall first, then the widest margin
+        order = np.lexsort((-margin, shortfall))[:n_elite]
+        elite = settings[order]
+        archive_x.append(elite)
+        archive_p.append({t: p[order] for t, p in predictions.items()})
+
+        mean = elite.mean(axis=0)
+        std = elite.std(axis=0)
+        if time.perf_counter() - start >= time_budget or np.all(std < 1e-3 * width):
+            break
+        settings = np.clip(rng.normal(mean, std + 1e-3 * width, size=(population, len(columns))), low, high)
+
+    X = np.vstack(archive_x)
+    predictions = {t: np.concatenate([p[t] for p in archive_p]) for t in models}
+    shortfall, margin = score_candidates(predictions, thresholds)
+    candidates = pd.DataFrame(X, columns=columns)
+    for target in models:
+        candidates[target] = predictions[target]
+    candidates["SHORTFALL"] = shortfall
+    candidates["MARGIN"] = margin
+    candidates["MEETS"] = shortfall == 0
+    candidates = (
+        candidates.round(3)
+        .drop_duplicates(subset=columns)
+        .sort_values(["SHORTFALL", "MARGIN"], ascending=[True, False])
+        .head(top_k)
+        .reset_index(drop=True)
+    )
+    elapsed = time.perf_counter() - start
+    info = {
+        "evaluations": evaluations,
+        "generations": generations,
+        "seconds": elapsed,
+        "evaluations_per_second": evaluations / elapsed if elapsed else 0.0,
+        "thresholds": thresholds,
+    }
+    return candidates, info
@@ -0,0 +1,207 @@
+"""Fitted preprocessing + model chain persisted as one serving artifact.
+
+QualityPipeline stores what train_models.py fits before the forest:
+the median imputer and the standard scaler, in the fixed FEATURE_COLS
+order. Serving builds one float matrix in that order and applies a
+single fused numpy transform, so inputs match training exactly.
+"""
+import numpy as np
+import pandas as pd
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import StandardScaler
+
+from forest_engine import compile_forest, is_forest, load_forest
+from model_format import export_forest
+from scoring import FEATURE_COLS, GRADE_COLS, build_input_matrix, normalize_columns, normalize_grade
+
+
+class QualityPipeline:
+    """Median imputation, standard scaling and a regressor in one object"""
+
+    def __init__(self, feature_names, medians, means, scales, model, target=None, diameter=None):
+        self.feature_names_in_ = np.array(feature_names, dtype=object)
+        self.n_features_in_ = len(feature_names)
+        self.medians = np.asarray(medians, dtype=np.float64)
+        self.means = np.asarray(means, dtype=np.float64)
+        self.scales = np.asarray(scales, dtype=np.float64)
+        self.model = model
+        self.target = target
+        self.diameter = diameter
+        # Newest training row, set by train_models.py for incremental updates
+        self.watermark = None
+        # Mean decrease in impurity per feature, captured at train time
+        self.feature_importances = None
+        self._compile()
+
+    def _compile(self):
+        # Precompiled column-index map and fused transform constants
+        self.column_index = {name: i for i, name in enumerate(self.feature_names_in_)}
+        self.grade_index = {
+            col[len("GRADE_"):]: self.column_index[col] for col in GRADE_COLS if col in self.column_index
+        }
+        self._inv_scale = 1.0 / self.scales
+        self._fill_scaled = (self.medians - self.means) * self._inv_scale
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("column_index", "grade_index", "_inv_scale", "_fill_scaled", "_compiled"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    @classmethod
+    def fit(cls, X, y, model, target=None, diameter=None):
+        """Fit the imputer, scaler and model on a raw FEATURE_COLS matrix"""
+        imputer = SimpleImputer(strategy="median", keep_empty_features=True).fit(X)
+        scaler = StandardScaler().fit(imputer.transform(X))
+        pipeline = cls(FEATURE_COLS, imputer.statistics_, scaler.mean_, scaler.scale_, model, target, diameter)
+        model.fit(pipeline.transform(X), np.asarray(y))
+        pipeline.feature_importances = getattr(model, "feature_importances_", None)
+        return pipeline
+
+    def with_model(self, model):
+        """Same preprocessing in front of a different (e.g. compiled) model"""
+        clone = QualityPipeline.__new__(QualityPipeline)
+        clone.__setstate__({**self.__getstate__(), "model": model})
+        return clone
+
+    def transform(self, X):
+        """Impute and scale a raw matrix in one fused pass"""
+        X = np.asarray(X, dtype=np.float64)
+        Z = (X - self.means) * self._inv_scale
+        nan_mask = np.isnan(Z)
+        if nan_mask.any():
+            Z = np.where(nan_mask, self._fill_scaled, Z)
+        return Z
+
+    def vector_from_record(self, record):
+        """One raw input row from a {column: value} dict via the column-index map"""
+        x = np.full((1, self.n_features_in_), np.nan)
+        for name, value in record.items():
+            if name == "GRADE":
+                grade_col = self.grade_index.get(normalize_grade(value))
+                for i in self.grade_index.values():
+                    x[0, i] = 1.0 if i == grade_col else 0.0
+                continue
+            i = self.column_index.get(name)
+            if i is not None and value is not None:
+                x[0, i] = value
+        return x
+
+    def predict(self, X):
+        if isinstance(X, pd.DataFrame):
+            X = build_input_matrix(normalize_columns(X), self.feature_names_in_)
+        return self.model.predict(self.transform(X))
+
+    def tree_model(self):
+        """The forest as a ForestEngine (per-tree outputs); sklearn forests are compiled once"""
+        if hasattr(self.model, "predict_trees"):
+            return self.model
+        if getattr(self, "_compiled", None) is None:
+            self._compiled = compile_forest(self.model)
+        return self._compiled
+
+    def predict_with_uncertainty(self, X, quantiles=(0.05, 0.95)):
+        """Mean, per-tree spread and a quantile interval from one forest pass.
+
+        Returns a dict of arrays: mean, std, lower, upper and the raw
+        (n_rows, n_trees) tree predictions for threshold checks.
+        """
+        if isinstance(X, pd.DataFrame):
+            X = build_input_matrix(normalize_columns(X), self.feature_names_in_)
+        return summarize_trees(self.tree_model().predict_trees(self.transform(X)), quantiles)
+
+    def global_importances(self):
+        """Train-time feature importances as a Series sorted high to low (None if unknown)"""
+        importances = getattr(self, "feature_importances", None)
+        if importances is None:
+            importances = getattr(self.model, "feature_importances_", None)
+        if importances is None:
+            return None
+        return pd.Series(importances, index=self.feature_names_in_).sort_values(ascending=False)
+
+    def contributions(self, X):
+        """Per-row feature attributions from the forest's decision paths.
+
+        Imputation and scaling act column by column, so each attribution
+        belongs to the raw input feature of the same name. Returns
+        (bias, DataFrame) where bias + row sum equals the prediction.
+        """
+        if isinstance(X, pd.DataFrame):
+            X = build_input_matrix(normalize_columns(X), self.feature_names_in_)
+        bias, contrib = self.tree_model().contributions(self.transform(X))
+        return bias, pd.DataFrame(contrib, columns=self.feature_names_in_)
+
+    def preprocess_meta(self):
+        """JSON-friendly preprocessing state stored alongside packed forests"""
+        return {
+            "feature_names": [str(c) for c in self.feature_names_in_],
+            "medians": self.medians.tolist(),
+            "means": self.means.tolist(),
+            "scales": self.scales.tolist(),
+            "target": self.target,
+            "diameter": self.diameter,
+        }
+
+    @classmethod
+    def from_preprocess_meta(cls, meta, model):
+        return cls(
+            meta["feature_names"], meta["medians"], meta["means"], meta["scales"],
+            model, meta.get("target"), meta.get("diameter"),
+        )
+
+
+def export_pipeline(pipeline, path):
+    """Write the pipeline's forest as a packed .forest directory with its preprocessing"""
+    extra_meta = {"preprocess": pipeline.preprocess_meta()}
+    importances = getattr(pipeline, "feature_importances", None)
+    if importances is not None:
+        extra_meta["feature_importances"] = np.asarray(importances, dtype=np.float64).tolist()
+    return export_forest(pipeline.model, path, extra_meta=extra_meta)
+
+
+def load_packed_pipeline(path, mmap=True):
+    """Open a .forest directory; wraps it in its preprocessing when present"""
+    engine = load_forest(path, mmap=mmap)
+    preprocess = engine.meta.get("preprocess")
+    if preprocess is None:
+        return engine
+    pipeline = QualityPipeline.from_preprocess_meta(preprocess, engine)
+    if engine.meta.get("feature_importances") is not None:
+        pipeline.feature_importances = np.asarray(engine.meta["feature_importances"])
+    return pipeline
+
+
+def compile_model(model):
+    """Swap sklearn forests (bare or inside a pipeline) for the numpy engine"""
+    if isinstance(model, QualityPipeline) and is_forest(model.model):
+        return model.with_model(compile_forest(model.model))
+    if is_forest(model):
+        return compile_forest(model)
+    return model
+
+
+def summarize_trees(trees, quantiles=(0.05, 0.95)):
+    """predict_with_uncertainty's dict from (n_rows, n_trees) per-tree predictions"""
+    lower, upper = np.quantile(trees, quantiles, axis=1)
+    return {
+        "mean": trees.mean(axis=1),
+        "std": trees.std(axis=1),
+        "lower": lower,
+        "upper": upper,
+        "trees": trees,
+    }
+
+
+def interval_confidence(mean, lower, upper):
+    """1 - (tree interval width / |mean|), clipped to [0, 1]; tighter tree agreement scores higher.
+
+    Not a pass/fail vote: predictions sit far above the grade minimums, so
+    every tree always agrees with the verdict and such a share is always 100%.
+    """
+    width = np.asarray(upper) - np.asarray(lower)
+    scale = np.maximum(np.abs(mean), 1e-9)
+    return np.clip(1.0 - width / scale, 0.0, 1.0)
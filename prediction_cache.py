@@ -0,0 +1,137 @@
+"""Bounded cache of single-row predictions.
+
+Entries are keyed by model key, model version (artifact signature on
+disk) and the raw input vector, optionally quantized to a fixed number
+of decimals so near-identical inputs share an entry. When a model's
+version changes, every entry computed with the old version is dropped.
+
+Defaults come from PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL (seconds)
+and PREDICTION_CACHE_DECIMALS (unset = exact match).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import get_metrics
+from model_registry import version_label
+from pipeline import interval_confidence
+from scoring import model_key as make_model_key, quality_threshold
+
+
+def _env_decimals():
+    value = os.environ.get("PREDICTION_CACHE_DECIMALS")
+    return int(value) if value not in (None, "") else None
+
+
+class PredictionCache:
+    """LRU + TTL cache with hit-rate counters and per-model invalidation"""
+
+    def __init__(self, max_entries=None, ttl_seconds=None, decimals="env"):
+        self.max_entries = max_entries or int(os.environ.get("PREDICTION_CACHE_SIZE", 4096))
+        self.ttl_seconds = ttl_seconds or float(os.environ.get("PREDICTION_CACHE_TTL", 3600))
+        self.decimals = _env_decimals() if decimals == "env" else decimals
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def make_key(self, model_key, version, x):
+        x = np.asarray(x, dtype=np.float64).ravel()
+        if self.decimals is not None:
+            # + 0.0 folds -0.0 into 0.0 after rounding
+            x = np.round(x, self.decimals) + 0.0
+        return (model_key, version, x.tobytes())
+
+    def _check_version(self, model_key, version):
+        # Drop everything computed with an older artifact of this model
+        known = self._versions.get(model_key)
+        if known == version:
+            return
+        if known is not None:
+            stale = [k for k in self._entries if k[0] == model_key and k[1] != version]
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += len(stale)
+        self._versions[model_key] = version
+
+    def get(self, key):
+        with self._lock:
+            self._check_version(key[0], key[1])
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._check_version(key[0], key[1])
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+def predict_one(registry, cache, target, diameter, record, shadow=None):
+    """Cached single-row prediction with uncertainty; None if the model is missing.
+
+    With a shadow evaluator, a cache miss also scores the key's shadow
+    candidate in the same forest pass (cache hits skip it).
+    """
+    key = make_model_key(target, diameter)
+    model, version = registry.get_with_version(key)
+    if model is None:
+        return None
+    metrics = get_metrics()
+    with metrics.span("feature_assembly"):
+        x = model.vector_from_record(record)
+        cache_key = cache.make_key(key, version, x)
+    result = cache.get(cache_key)
+    if result is None:
+        threshold = quality_threshold(target, record.get("GRADE"))
+        with metrics.span("predict"):
+            if shadow is None:
+                out = model.predict_with_uncertainty(x)
+            else:
+                out = shadow.predict_with_uncertainty(key, model, x, threshold, version)
+        result = {
+            "prediction": float(out["mean"][0]),
+            "std": float(out["std"][0]),
+            "lower": float(out["lower"][0]),
+            "upper": float(out["upper"][0]),
+            "confidence": float(interval_confidence(out["mean"], out["lower"], out["upper"])[0]),
+            "model_version": version_label(version),
+        }
+        cache.put(cache_key, result)
+    return result
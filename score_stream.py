@@ -0,0 +1,213 @@
+"""Score historian exports of any size with bounded memory.
+
+Input is read chunk by chunk from CSV, Parquet or XLSX (workbooks go
+through the ingest.py columnar cache first). Each chunk runs through the
+same scoring.score_frame the app and the server use, which routes rows
+by DIAMETER to the matching quality{1,2}_d{d} model. Results are
+appended to the output as each chunk finishes. With --workers > 1,
+chunks are scored in worker processes. At most 2 x workers chunks are
+in flight at once, so a slow writer never lets unread results pile up
+in memory. Output rows keep the input order. Parquet is decoded one
+row group at a time, so peak memory follows the row-group size rather
+than the file size.
+
+    python score_stream.py exports/2024.parquet -o scored_2024.parquet
+    python score_stream.py exports/march.csv -o scored_march.csv --workers 0 --chunk-rows 200000
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import forest_engine
+from ingest import ensure_cache
+from model_registry import get_registry
+from scoring import MODEL_DIR, TARGETS, normalize_columns, score_frame, unscored_rows
+
+CHUNK_ROWS = 100_000
+PRED_SUFFIXES = ("_PRED", "_STD", "_P05", "_P95")
+
+
+def iter_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Yield DataFrames of at most chunk_rows rows from a CSV, Parquet or XLSX file"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".xlsx":
+        path, ext = ensure_cache(path), ".parquet"
+    if ext == ".parquet":
+        # pre_buffer keeps every row group it has read alive; turn it off for flat memory
+        for batch in pq.ParquetFile(path, pre_buffer=False).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif ext == ".csv":
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+    else:
+        raise ValueError(f"Unsupported input format: {ext}")
+
+
+class ChunkWriter:
+    """Append scored chunks to a CSV or Parquet file with a fixed column layout"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.is_parquet = path.lower().endswith(".parquet")
+        self.columns = None
+        self.schema = None
+        self._writer = None
+        self._header_written = False
+
+    def write(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        df = df.reindex(columns=self.columns)
+        if not self.is_parquet:
+            df.to_csv(self.tmp_path, mode="a" if self._header_written else "w",
+                      header=not self._header_written, index=False)
+            self._header_written = True
+            return
+        if self.schema is None:
+            # Integers may turn into NaN-bearing floats in later chunks; widen up front
+            fields = [
+                pa.field(f.name, pa.float64()) if pa.types.is_integer(f.type) else f
+                for f in pa.Schema.from_pandas(df, preserve_index=False)
+            ]
+            self.schema = pa.schema(fields)
+            self._writer = pq.ParquetWriter(self.tmp_path, self.schema)
+        self._writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def commit(self):
+        """Finish the file and move it into place; only called once every chunk is written"""
+        self.close()
+        if os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        """Drop a partial output, so a failed run never leaves a file that looks finished"""
+        self.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def output_columns(df, targets, uncertainty):
+    """Input columns followed by every prediction column, so each chunk has the same layout"""
+    suffixes = PRED_SUFFIXES if uncertainty else PRED_SUFFIXES[:1]
+    preds = [f"{t}{s}" for t in targets for s in suffixes]
+    return [c for c in normalize_columns(df).columns if c not in preds] + preds
+
+
+def score_chunk(chunk, model_dir=MODEL_DIR, targets=TARGETS, default_diameter=None, uncertainty=True):
+    """Score one chunk with this process's registry; returns (result, missing model keys)"""
+    models = get_registry(model_dir)
+    result, missing = score_frame(
+        chunk, models, targets=targets, default_diameter=default_diameter, uncertainty=uncertainty
+    )
+    return result, missing
+
+
+def _init_worker():
+    # Parallelism comes from the processes; keep each engine on one thread
+    forest_engine.ENGINE_THREADS = 1
+
+
+def score_file(source, dest, model_dir=MODEL_DIR, targets=TARGETS, chunk_rows=CHUNK_ROWS,
+               workers=1, default_diameter=None, uncertainty=True):
+    """Stream source through the models into dest; returns a summary dict"""
+    start = time.perf_counter()
+    writer = ChunkWriter(dest)
+    missing = set()
+    n_rows = n_chunks = n_unscored = 0
+    columns = None
+
+    def emit(result, chunk_missing):
+        nonlocal n_rows, n_chunks, n_unscored
+        writer.write(result.reindex(columns=columns))
+        missing.update(chunk_missing)
+        n_rows += len(result)
+        n_unscored += unscored_rows(result, targets)
+        n_chunks += 1
+        print(f"⏱ {n_rows:,} rows scored ({n_rows / (time.perf_counter() - start):,.0f} rows/s)")
+
+    kwargs = dict(model_dir=model_dir, targets=targets, default_diameter=default_diameter, uncertainty=uncertainty)
+    try:
+        if workers <= 1:
+            for chunk in iter_chunks(source, chunk_rows):
+                columns = columns or output_columns(chunk, targets, uncertainty)
+                emit(*score_chunk(chunk, **kwargs))
+        else:
+            # Bounded FIFO window: submit ahead, but never more than max_in_flight chunks
+            max_in_flight = 2 * workers
+            pending = deque()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                for chunk in iter_chunks(source, chunk_rows):
+                    columns = columns or output_columns(chunk, targets, uncertainty)
+                    if len(pending) >= max_in_flight:
+                        emit(*pending.popleft().result())
+                    pending.append(pool.submit(score_chunk, chunk, **kwargs))
+                while pending:
+                    emit(*pending.popleft().result())
+    except BaseException:
+        writer.discard()
+        raise
+    writer.commit()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": n_rows,
+        "chunks": n_chunks,
+        "seconds": elapsed,
+        "rows_per_second": n_rows / elapsed if elapsed else 0.0,
+        "missing_models": sorted(missing),
+        "unscored_rows": n_unscored,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Score large CSV/Parquet/XLSX exports chunk by chunk")
+    parser.add_argument("source", help="Input file (.csv, .parquet or .xlsx)")
+    parser.add_argument("-o", "--output", required=True, help="Output file (.csv or .parquet)")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--targets", nargs="+", default=TARGETS, type=str.upper)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                        help=f"Rows per chunk (default: {CHUNK_ROWS:,})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; 0 = one per core (default: 1, in-process)")
+    parser.add_argument("--diameter", type=float, default=None,
+                        help="Diameter for inputs without a DIAMETER column")
+    parser.add_argument("--no-uncertainty", action="store_true",
+                        help="Only write {target}_PRED (skips the per-tree spread columns)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workers = args.workers or os.cpu_count() or 1
+    if not get_registry(args.model_dir):
+        print("❌ No models found!")
+        return 1
+    print(f"🚀 Scoring {args.source} in {args.chunk_rows:,}-row chunks with {workers} worker(s)")
+    summary = score_file(
+        args.source, args.output, model_dir=args.model_dir, targets=args.targets,
+        chunk_rows=args.chunk_rows, workers=workers, default_diameter=args.diameter,
+        uncertainty=not args.no_uncertainty,
+    )
+    if summary["missing_models"]:
+        print(f"⚠️ No model for: {', '.join(summary['missing_models'])}")
+    if summary["unscored_rows"]:
+        print(f"⚠️ {summary['unscored_rows']:,} row(s) left unscored (no usable DIAMETER or model)")
+    print(f"🎉 Wrote {summary['rows']:,} rows to {args.output} in {summary['seconds']:.1f}s "
+          f"({summary['rows_per_second']:,.0f} rows/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+# --- FEATURE LAYOUT ---
+CHEM_COLS = [f"CHEM{i}" for i in range(1, 11)]
+TEMP_COLS = [f"TEMP{i}" for i in range(1, 7)]
+PROCESS_COLS = [f"PROCESS{i}" for i in range(1, 4)]
+INPUT_COLS = CHEM_COLS + TEMP_COLS + ["SPEED"] + PROCESS_COLS
+GRADES = ["GR1", "GR2", "GR3"]
+GRADE_COLS = [f"GRADE_{g}" for g in GRADES]
+# Model input order shared by training and serving
+FEATURE_COLS = INPUT_COLS + GRADE_COLS
+DIAMETERS = [10, 12, 16]
+TARGETS = ["QUALITY1", "QUALITY2"]
+
+# Minimum QUALITY1/QUALITY2 per grade; the single source for the app,
+# the About tab, the server and the optimizer
+GRADE_STANDARDS = {
+    "GR1": {"QUALITY1": 70, "QUALITY2": 75},
+    "GR2": {"QUALITY1": 80, "QUALITY2": 85},
+    "GR3": {"QUALITY1": 90, "QUALITY2": 95},
+}
+
+# Column names used by the plant exports that differ from the app's names
+COLUMN_ALIASES = {"PEOCESS3": "PROCESS3"}
+
+
+def model_key(target, diameter):
+    """Registry key for a (target, diameter) model, e.g. quality1_d10"""
+    return f"{target.lower()}_d{int(float(diameter))}"
+
+
+def normalize_grade(grade):
+    """Map 'GR 1', 'gr1', ... to the canonical 'GR1' form"""
+    return str(grade).replace(" ", "").upper()
+
+
+def quality_threshold(target, grade=None):
+    """Minimum value of target for grade (the least strict grade if unknown)"""
+    standards = GRADE_STANDARDS.get(normalize_grade(grade)) if grade is not None else None
+    return (standards or GRADE_STANDARDS[GRADES[0]])[target]
+
+
+def normalize_columns(df):
+    """Upper-case headers and rename known export aliases"""
+    df = df.rename(columns=lambda c: str(c).strip().upper())
+    return df.rename(columns=COLUMN_ALIASES)
+
+
+def normalize_record(record):
+    """Canonical column names for a single {column: value} input dict"""
+    record = {str(k).strip().upper(): v for k, v in record.items()}
+    return {COLUMN_ALIASES.get(k, k): v for k, v in record.items()}
+
+
+def build_input_matrix(df, feature_names=None):
+    """Raw model inputs for every row of df as one float matrix.
+
+    Columns follow feature_names (FEATURE_COLS by default); GRADE is
+    expanded into its one-hot columns and anything the input lacks is
+    left as NaN for the pipeline's imputer.
+    """
+    if feature_names is None:
+        feature_names = FEATURE_COLS
+    X = np.full((len(df), len(feature_names)), np.nan)
+    grades = df["GRADE"].map(normalize_grade).to_numpy() if "GRADE" in df.columns else None
+    for i, name in enumerate(feature_names):
+        if name in df.columns:
+            X[:, i] = pd.to_numeric(df[name], errors="coerce")
+        elif grades is not None and name.startswith("GRADE_"):
+            X[:, i] = grades == name[len("GRADE_"):]
+    return X
+
+
+def score_frame(df, models, targets=TARGETS, default_diameter=None, uncertainty=True, shadow=None):
+    """Score every row of df with one vectorized predict per model.
+
+    Rows are grouped by DIAMETER and each group is sent through the
+    matching quality{1,2}_d{d} model; blank or unreadable diameters use
+    default_diameter when it is given. Returns a copy of df with a
+    {target}_PRED column per target (NaN where no model is available)
+    and the list of model keys that were missing. With uncertainty, models
+    that support it also fill {target}_STD, {target}_P05 and {target}_P95
+    from the same forest pass. A shadow evaluator scores each key's shadow
+    candidate in that pass as well, against the rows' GRADE thresholds.
+    result.attrs["model_versions"] maps each scored model key to the
+    version it was scored with.
+    """
+    df = normalize_columns(df).reset_index(drop=True)
+    if "DIAMETER" not in df.columns:
+        if default_diameter is None:
+            raise ValueError("Input has no DIAMETER column")
+        df["DIAMETER"] = default_diameter
+
+    diameters = pd.to_numeric(df["DIAMETER"], errors="coerce")
+    if default_diameter is not None and diameters.isna().any():
+        diameters = diameters.fillna(float(default_diameter))
+        df["DIAMETER"] = diameters
+    result = df.copy()
+    missing, versions = [], {}
+    for target in targets:
+        result[f"{target}_PRED"] = np.nan
+    for diameter, group in df.groupby(diameters, sort=True):
+        matrices = {}
+        for target in targets:
+            key = model_key(target, diameter)
+            # Model and version in one read, so a hot swap cannot pair one with the other
+            if hasattr(models, "get_with_version"):
+                model, version = models.get_with_version(key)
+            else:
+                model, version = models.get(key), None
+            if model is None:
+                missing.append(key)
+                continue
+            versions[key] = version
+            # Both targets of a diameter usually share one feature layout
+            names = tuple(getattr(model, "feature_names_in_", FEATURE_COLS))
+            if names not in matrices:
+                matrices[names] = build_input_matrix(group, names)
+            if uncertainty and hasattr(model, "predict_with_uncertainty"):
+                if shadow is None:
+                    out = model.predict_with_uncertainty(matrices[names])
+                else:
+                    grades = group["GRADE"] if "GRADE" in group.columns else [None] * len(group)
+                    thresholds = np.array([quality_threshold(target, g) for g in grades], dtype=np.float64)
+                    out = shadow.predict_with_uncertainty(key, model, matrices[names], thresholds, version)
+                result.loc[group.index, f"{target}_PRED"] = out["mean"]
+                result.loc[group.index, f"{target}_STD"] = out["std"]
+                result.loc[group.index, f"{target}_P05"] = out["lower"]
+                result.loc[group.index, f"{target}_P95"] = out["upper"]
+            else:
+                result.loc[group.index, f"{target}_PRED"] = model.predict(matrices[names])
+    result.attrs["model_versions"] = versions
+    return result, missing
+
+
+def unscored_rows(result, targets=TARGETS):
+    """Number of rows score_frame could not score for any target (no usable DIAMETER or model)"""
+    preds = result[[f"{t}_PRED" for t in targets if f"{t}_PRED" in result.columns]]
+    return int(preds.isna().all(axis=1).sum())
+
+
+def score_records(records, models, targets=TARGETS, shadow=None):
+    """Score a list of input dicts (one per heat) in one batched pass"""
+    df = pd.DataFrame.from_records(records)
+    if df.empty:
+        return [], []
+    result, missing = score_frame(df, models, targets=targets, shadow=shadow)
+    return prediction_rows(result, targets), missing
+
+
+def prediction_rows(result, targets=TARGETS):
+    """JSON-ready prediction dicts (one per row) from a score_frame result"""
+    pred_cols = [
+        f"{t}{suffix}" for t in targets for suffix in ("_PRED", "_STD", "_P05", "_P95")
+        if f"{t}{suffix}" in result.columns
+    ]
+    preds = result[pred_cols].rename(columns=lambda c: c[:-len("_PRED")] if c.endswith("_PRED") else c)
+    rows = [
+        {k: (None if pd.isna(v) else float(v)) for k, v in row.items()}
+        for row in preds.to_dict(orient="records")
+    ]
+    return rows
+
+
+def read_batch_file(uploaded_file):
+    """Read an uploaded CSV or Excel file into a DataFrame"""
+    name = getattr(uploaded_file, "name", str(uploaded_file))
+    ext = os.path.splitext(name)[1].lower()
+    if ext in (".xlsx", ".xls"):
+        return pd.read_excel(uploaded_file)
+    if ext == ".csv":
+        return pd.read_csv(uploaded_file)
+    raise ValueError(f"Unsupported file type: {ext or name}")
+
+
+def to_csv_bytes(df):
+    """Serialize a result frame for st.download_button"""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False)
+    return buffer.getvalue().encode("utf-8")
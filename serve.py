@@ -0,0 +1,242 @@
+"""Headless JSON scoring service for the rebar quality models.
+
+Runs outside Streamlit with the models kept resident in memory:
+
+    python serve.py --host 0.0.0.0 --port 8502
+
+POST /predict        {"DIAMETER": 10, "GRADE": "GR 1", "CHEM1": 0.21, ...}
+POST /predict_batch  {"records": [{...}, {...}]}  rows that could not be scored
+                     carry an "error"; "unscored" counts them
+GET  /health
+GET  /metrics        Prometheus text format
+GET  /drift          Rolling input-drift scores per diameter
+GET  /shadow         Production vs shadow-candidate comparison per model
+
+Candidates in <model-dir>/shadow are scored next to production on every
+request (see shadow.py); responses always carry the production values.
+Every scored prediction is appended to the shared history log under
+session "api" (see history_store.py).
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from drift import get_drift_monitor
+from history_store import frame_entries, get_history_store
+from metrics import get_metrics
+from model_registry import get_registry
+from prediction_cache import PredictionCache, predict_one
+from shadow import get_shadow
+from scoring import (
+    DIAMETERS, INPUT_COLS, MODEL_DIR, TARGETS, model_key, normalize_grade, normalize_record, prediction_rows,
+    quality_threshold, score_frame,
+)
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+HISTORY_SESSION = "api"
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """Request handler; the shared models live on the server object"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length <= 0 or length > MAX_BODY_BYTES:
+            raise ValueError("Missing or oversized request body")
+        return json.loads(self.rfile.read(length))
+
+    def _targets(self, payload):
+        target = payload.get("TARGET") or payload.get("target")
+        if target is None:
+            return TARGETS
+        target = str(target).upper()
+        if target not in TARGETS:
+            raise ValueError(f"Unknown target: {target}")
+        return [target]
+
+    def _predict_one(self, payload):
+        record = normalize_record(payload)
+        if "DIAMETER" not in record:
+            raise ValueError("Input has no DIAMETER")
+        self.server.drift.observe_record(record["DIAMETER"], record)
+        prediction, versions, missing, entries = {}, {}, [], []
+        grade = normalize_grade(record["GRADE"]) if record.get("GRADE") is not None else None
+        inputs = {c: record[c] for c in INPUT_COLS if c in record}
+        for target in self._targets(payload):
+            result = predict_one(self.server.models, self.server.cache, target, record["DIAMETER"], record,
+                                 shadow=self.server.shadow)
+            if result is None:
+                missing.append(model_key(target, record["DIAMETER"]))
+                prediction[target] = None
+                continue
+            prediction[target] = result["prediction"]
+            prediction[f"{target}_STD"] = result["std"]
+            prediction[f"{target}_P05"] = result["lower"]
+            prediction[f"{target}_P95"] = result["upper"]
+            versions[target] = result["model_version"]
+            entries.append({
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "session_id": HISTORY_SESSION,
+                "diameter": float(record["DIAMETER"]),
+                "grade": grade,
+                "target": target,
+                "prediction": result["prediction"],
+                "std": result["std"],
+                "lower": result["lower"],
+                "upper": result["upper"],
+                "confidence": result["confidence"],
+                "meets": result["prediction"] >= quality_threshold(target, grade),
+                "model_version": result["model_version"],
+                "inputs": inputs,
+            })
+        self.server.history.append_many(entries)
+        return {"prediction": prediction, "model_versions": versions, "missing_models": missing}
+
+    @staticmethod
+    def _flag_unscored(result, rows, targets):
+        """Give rows no model could score an "error"; returns how many there were"""
+        unscored = 0
+        if result.empty:
+            return unscored
+        diameters = pd.to_numeric(result["DIAMETER"], errors="coerce")
+        for i, row in enumerate(rows):
+            if any(row.get(target) is not None for target in targets):
+                continue
+            unscored += 1
+            if pd.isna(diameters.iloc[i]):
+                row["error"] = "Missing or unparseable DIAMETER"
+            else:
+                row["error"] = f"No model for diameter {diameters.iloc[i]:g}"
+        return unscored
+
+    def _send_text(self, status, text):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_text(200, get_metrics().render_prometheus())
+        elif self.path == "/drift":
+            report = {}
+            for d in DIAMETERS:
+                scores = self.server.drift.scores(d)
+                if scores is not None:
+                    report[str(d)] = scores
+            self._send_json(200, report)
+        elif self.path == "/shadow":
+            self._send_json(200, self.server.shadow.summary())
+        elif self.path == "/health":
+            self._send_json(200, {
+                "status": "ok",
+                "models": sorted(self.server.models),
+                "cache": self.server.models.cache_info(),
+                "prediction_cache": self.server.cache.info(),
+            })
+        else:
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        try:
+            payload = self._read_json()
+            if self.path == "/predict":
+                if not isinstance(payload, dict):
+                    raise ValueError("Expected a JSON object")
+                response = self._predict_one(payload)
+            elif self.path == "/predict_batch":
+                records = payload.get("records") if isinstance(payload, dict) else payload
+                if not isinstance(records, list):
+                    raise ValueError("Expected a list of records")
+                targets = self._targets(payload) if isinstance(payload, dict) else TARGETS
+                df = pd.DataFrame.from_records(records)
+                rows, missing, unscored = [], [], 0
+                if not df.empty:
+                    result, missing = score_frame(df, self.server.models, targets, shadow=self.server.shadow)
+                    rows = prediction_rows(result, targets)
+                    unscored = self._flag_unscored(result, rows, targets)
+                    self.server.history.append_many(frame_entries(result, HISTORY_SESSION, targets))
+                self.server.drift.observe_frame(df)
+                response = {"predictions": rows, "missing_models": sorted(set(missing)), "unscored": unscored}
+            else:
+                self._send_json(404, {"error": f"Unknown path: {self.path}"})
+                return
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, response)
+        get_metrics().observe(f"request{self.path.replace('/', '_')}", time.perf_counter() - start)
+
+
+def make_server(host, port, models, verbose=False):
+    """Build a threaded server that shares one set of loaded models"""
+    server = ThreadingHTTPServer((host, port), ScoringHandler)
+    server.daemon_threads = True
+    server.models = models
+    server.cache = PredictionCache()
+    server.drift = get_drift_monitor(getattr(models, "model_dir", MODEL_DIR))
+    server.shadow = get_shadow(getattr(models, "model_dir", MODEL_DIR))
+    server.history = get_history_store()
+    server.verbose = verbose
+    metrics = get_metrics()
+    if hasattr(models, "cache_info"):
+        metrics.register_gauges("model_cache", models.cache_info)
+    metrics.register_gauges("prediction_cache", server.cache.info)
+    metrics.register_gauges("drift", server.drift.info)
+    metrics.register_gauges("shadow", server.shadow.info)
+    metrics.register_gauges("history", server.history.info)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve rebar quality predictions over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--preload", action="store_true", help="Load every model before serving")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    models = get_registry(args.model_dir)
+    if args.preload:
+        models.load_all()
+    models.start_watcher()
+    # Candidates are hot-swapped too, so a retrained shadow needs no restart
+    get_shadow(args.model_dir).registry.start_watcher()
+    if not models:
+        print("❌ No models found!")
+    server = make_server(args.host, args.port, models, verbose=args.verbose)
+    print(f"🚀 Serving {len(models)} models on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Shadow evaluation of candidate models on live traffic.
+
+Candidates are saved under the production key in models/shadow/, for
+example models/shadow/quality1_d10.forest (train_models.py --shadow).
+When the app or the server scores a key that has a candidate, production
+and shadow run in the same tree walk. The two packed forests are
+concatenated into one ForestEngine over the feature space [Zp | Zs]:
+
+- production trees read the first block of columns, shadow trees the
+  second;
+- each block is filled by its own pipeline's imputation and scaling;
+- the per-tree outputs are split apart again afterwards.
+
+The shadow adds its trees to one batched pass. It does not cost a
+second pass over the rows.
+
+Per key, the comparison is kept as running totals:
+- rows;
+- mean and max absolute difference, and mean signed difference;
+- pass/fail flips against the grade thresholds.
+
+The totals restart whenever either model is swapped. Disagreements are
+rows where the call flips, or where the gap exceeds SHADOW_DIFF_TOLERANCE.
+They are appended to data/shadow_disagreements.jsonl, at most
+MAX_LOGGED_PER_CALL per call, so a large upload cannot flood the log.
+
+    python shadow.py status
+    python shadow.py promote quality1_d10   # the candidate replaces production
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from forest_engine import ForestEngine, is_forest
+from model_format import FOREST_SUFFIX, replace_dir
+from model_registry import get_registry
+from pipeline import summarize_trees
+from scoring import MODEL_DIR
+
+SHADOW_DIR = "shadow"
+LOG_PATH = os.environ.get(
+    "QUALITY_SHADOW_LOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "shadow_disagreements.jsonl"),
+)
+DIFF_TOLERANCE = float(os.environ.get("SHADOW_DIFF_TOLERANCE", 10.0))
+MAX_LOGGED_PER_CALL = 20
+ARTIFACT_SUFFIXES = (FOREST_SUFFIX, ".pkl", ".watermark.json", ".tuning.json")
+
+_evaluators = {}
+_evaluators_lock = threading.Lock()
+
+
+def combine_forests(prod, shadow):
+    """One ForestEngine holding prod's trees then shadow's, over the columns [Zp | Zs]"""
+    n_nodes = len(prod.left)
+    arrays = {
+        "roots": np.concatenate([prod.roots, shadow.roots + n_nodes]),
+        "left": np.concatenate([prod.left, shadow.left + n_nodes]),
+        "right": np.concatenate([prod.right, shadow.right + n_nodes]),
+        "feature": np.concatenate([prod.feature, shadow.feature + prod.n_features_in_]).astype(np.int32),
+        "threshold": np.concatenate([prod.threshold, shadow.threshold]),
+        "value": np.concatenate([prod.value, shadow.value]),
+        "missing_left": np.concatenate([prod.missing_left, shadow.missing_left]),
+    }
+    meta = {
+        "n_trees": prod.n_trees + shadow.n_trees,
+        "n_nodes": int(len(arrays["left"])),
+        "max_depth": max(prod.max_depth, shadow.max_depth),
+        "n_features": prod.n_features_in_ + shadow.n_features_in_,
+    }
+    return ForestEngine(arrays, meta)
+
+
+class ShadowStats:
+    """Running production-vs-shadow comparison for one key and one pair of versions"""
+
+    def __init__(self, shadow_version):
+        self.shadow_version = shadow_version
+        self.since = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.rows = 0
+        self.abs_diff_sum = 0.0
+        self.diff_sum = 0.0
+        self.max_abs_diff = 0.0
+        self.pass_to_fail = 0
+        self.fail_to_pass = 0
+        self.disagreements = 0
+        self._lock = threading.Lock()
+
+    def update(self, diff, prod_pass, shadow_pass, disagree):
+        with self._lock:
+            self.rows += len(diff)
+            self.abs_diff_sum += float(np.abs(diff).sum())
+            self.diff_sum += float(diff.sum())
+            self.max_abs_diff = max(self.max_abs_diff, float(np.abs(diff).max(initial=0.0)))
+            self.pass_to_fail += int((prod_pass & ~shadow_pass).sum())
+            self.fail_to_pass += int((~prod_pass & shadow_pass).sum())
+            self.disagreements += int(disagree.sum())
+
+    def summary(self):
+        n = self.rows
+        return {
+            "shadow_version": self.shadow_version,
+            "since": self.since,
+            "rows": n,
+            "mean_abs_diff": self.abs_diff_sum / n if n else None,
+            "mean_diff": self.diff_sum / n if n else None,
+            "max_abs_diff": self.max_abs_diff if n else None,
+            "pass_to_fail": self.pass_to_fail,
+            "fail_to_pass": self.fail_to_pass,
+            "flip_rate": (self.pass_to_fail + self.fail_to_pass) / n if n else None,
+            "disagreements": self.disagreements,
+        }
+
+
+class ShadowEvaluator:
+    """Scores production and its candidate together and keeps the comparison"""
+
+    def __init__(self, registry, log_path=LOG_PATH, tolerance=DIFF_TOLERANCE):
+        self.registry = registry
+        self.log_path = log_path
+        self.tolerance = tolerance
+        self._combined = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    def candidate(self, key):
+        """(shadow model, version) for key, or (None, None) without a candidate"""
+        if key not in self.registry:
+            return None, None
+        return self.registry.get_with_version(key)
+
+    def _combined_engine(self, key, model, prod_version, shadow, version):
+        """The cached [prod | shadow] engine for key; None when the two cannot share a pass.
+
+        Entries are keyed on both versions and hold no model objects, so a
+        hot-swapped production model is freed as soon as the registry drops
+        it. A change on either side rebuilds the engine and restarts the totals.
+        """
+        entry = self._combined.get(key)
+        if entry is not None and entry[0] == prod_version and entry[1] == version:
+            return entry[2]
+        with self._lock:
+            # Drop the stale engine before building the next, so two never coexist
+            self._combined.pop(key, None)
+        prod_forest, shadow_forest = _forest_of(model), _forest_of(shadow)
+        engine = None
+        if prod_forest is not None and shadow_forest is not None:
+            engine = combine_forests(prod_forest, shadow_forest)
+        with self._lock:
+            self._combined[key] = (prod_version, version, engine)
+            self._stats[key] = ShadowStats(self.registry.version_id(key))
+        return engine
+
+    def predict_with_uncertainty(self, key, model, X, thresholds, prod_version=None, quantiles=(0.05, 0.95)):
+        """model.predict_with_uncertainty(X), with key's candidate scored in the same pass.
+
+        X is a raw matrix in model's feature order; thresholds is the
+        pass/fail minimum, one value or one per row. prod_version is the
+        registry version of model (registry.version(key)). Without a
+        candidate (or with one on a different feature layout) this is
+        exactly the production call.
+        """
+        shadow, version = self.candidate(key)
+        if shadow is None:
+            # Candidate removed or promoted: release its combined engine
+            self._combined.pop(key, None)
+            return model.predict_with_uncertainty(X, quantiles)
+        if list(shadow.feature_names_in_) != list(model.feature_names_in_):
+            return model.predict_with_uncertainty(X, quantiles)
+        if prod_version is None:
+            # Plain {key: model} mappings never hot-swap; the object identity stands in
+            prod_version = id(model)
+        engine = self._combined_engine(key, model, prod_version, shadow, version)
+        if engine is None:
+            # A candidate that is not a forest (e.g. boosting) is scored on its own
+            out = model.predict_with_uncertainty(X, quantiles)
+            shadow_mean = shadow.predict(X)
+        else:
+            n_prod = model.tree_model().n_trees
+            trees = engine.predict_trees(np.hstack([model.transform(X), shadow.transform(X)]))
+            out = summarize_trees(trees[:, :n_prod], quantiles)
+            shadow_mean = trees[:, n_prod:].mean(axis=1)
+        self._record(key, np.asarray(X), out["mean"], shadow_mean, thresholds, model)
+        return out
+
+    def _record(self, key, X, prod_mean, shadow_mean, thresholds, model):
+        thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float64), prod_mean.shape)
+        diff = shadow_mean - prod_mean
+        prod_pass = prod_mean >= thresholds
+        shadow_pass = shadow_mean >= thresholds
+        disagree = (prod_pass != shadow_pass) | (np.abs(diff) > self.tolerance)
+        stats = self._stats[key]
+        stats.update(diff, prod_pass, shadow_pass, disagree)
+        if disagree.any():
+            self._log(key, stats.shadow_version, X, prod_mean, shadow_mean, thresholds, disagree, model)
+
+    def _log(self, key, shadow_version, X, prod_mean, shadow_mean, thresholds, disagree, model):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        names = [str(c) for c in model.feature_names_in_]
+        lines = []
+        for i in np.flatnonzero(disagree)[:MAX_LOGGED_PER_CALL]:
+            lines.append(json.dumps({
+                "timestamp": timestamp,
+                "model": key,
+                "shadow_version": shadow_version,
+                "prediction": float(prod_mean[i]),
+                "shadow_prediction": float(shadow_mean[i]),
+                "diff": float(shadow_mean[i] - prod_mean[i]),
+                "threshold": float(thresholds[i]),
+                "flip": bool((prod_mean[i] >= thresholds[i]) != (shadow_mean[i] >= thresholds[i])),
+                "inputs": {n: (None if np.isnan(v) else float(v)) for n, v in zip(names, X[i])},
+            }))
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+            with self._log_lock, open(self.log_path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"❌ Shadow log write failed: {e}")
+
+    def summary(self):
+        """{key: comparison totals} for every key scored with a candidate"""
+        return {key: stats.summary() for key, stats in sorted(self._stats.items())}
+
+    def info(self):
+        """Flat numbers for the Prometheus gauges"""
+        values = {}
+        for key, s in self.summary().items():
+            values[f"{key}_rows"] = s["rows"]
+            values[f"{key}_disagreements"] = s["disagreements"]
+            if s["mean_abs_diff"] is not None:
+                values[f"{key}_mean_abs_diff"] = s["mean_abs_diff"]
+                values[f"{key}_flip_rate"] = s["flip_rate"]
+        return values
+
+
+def _forest_of(model):
+    """model's trees as a ForestEngine, or None for models that are not forests"""
+    inner = getattr(model, "model", None)
+    if inner is None or not (hasattr(inner, "predict_trees") or is_forest(inner)):
+        return None
+    return model.tree_model()
+
+
+def get_shadow(model_dir=MODEL_DIR):
+    """The process-wide evaluator for model_dir's candidates (model_dir/shadow)"""
+    shadow_dir = os.path.join(os.path.abspath(model_dir), SHADOW_DIR)
+    with _evaluators_lock:
+        evaluator = _evaluators.get(shadow_dir)
+        if evaluator is None:
+            evaluator = _evaluators[shadow_dir] = ShadowEvaluator(get_registry(shadow_dir))
+        return evaluator
+
+
+def promote(key, model_dir=MODEL_DIR):
+    """Move key's candidate artifacts over production; returns the moved file names"""
+    shadow_dir = os.path.join(model_dir, SHADOW_DIR)
+    moved = []
+    # The packed forest goes first: it is what the registry serves
+    for suffix in ARTIFACT_SUFFIXES:
+        source = os.path.join(shadow_dir, f"{key}{suffix}")
+        if not os.path.exists(source):
+            continue
+        dest = os.path.join(model_dir, f"{key}{suffix}")
+        if os.path.isdir(source):
+            replace_dir(source, dest)
+        else:
+            os.replace(source, dest)
+        moved.append(os.path.basename(dest))
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and promote shadow candidates")
+    parser.add_argument("command", choices=["status", "promote"])
+    parser.add_argument("keys", nargs="*", help="Model keys to promote, e.g. quality1_d10")
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    args = parser.parse_args(argv)
+
+    candidates = get_registry(os.path.join(args.model_dir, SHADOW_DIR)).discover()
+    if args.command == "status":
+        if not candidates:
+            print("🧪 No shadow candidates")
+        for key in candidates:
+            print(f"🧪 {key}")
+        return 0
+    if not args.keys:
+        parser.error("promote needs at least one model key")
+    for key in args.keys:
+        if key not in candidates:
+            print(f"❌ No shadow candidate for {key}")
+            return 1
+        print(f"🚀 Promoted {key}: {', '.join(promote(key, args.model_dir))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""ForestEngine must predict exactly like the sklearn forest it was packed from."""
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+import forest_engine
+from forest_engine import ForestEngine, compile_forest, load_forest
+from model_format import export_forest
+
+
+def make_data(n_rows=400, n_features=6, nan_share=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n_rows, n_features))
+    y = 3 * X[:, 0] - 2 * X[:, 1] ** 2 + X[:, 2] * X[:, 3] + rng.normal(scale=0.1, size=n_rows)
+    if nan_share:
+        X[rng.random(X.shape) < nan_share] = np.nan
+    return X, y
+
+
+def fit_forest(X, y, n_estimators=25):
+    return RandomForestRegressor(n_estimators=n_estimators, max_depth=10, random_state=0).fit(X, y)
+
+
+def assert_matches(model, engine, X):
+    np.testing.assert_allclose(engine.predict(X), model.predict(X), rtol=1e-12, atol=1e-12)
+    per_tree = np.column_stack([est.predict(X) for est in model.estimators_])
+    np.testing.assert_allclose(engine.predict_trees(X), per_tree, rtol=1e-12, atol=1e-12)
+
+
+def test_matches_sklearn_on_clean_inputs():
+    X, y = make_data()
+    model = fit_forest(X, y)
+    assert_matches(model, compile_forest(model), make_data(seed=1)[0])
+
+
+@pytest.mark.parametrize("train_nan_share", [0.0, 0.15])
+def test_nan_inputs_follow_missing_left(train_nan_share):
+    # With NaNs in training, splits learn which side missing values take; the packed
+    # missing_left must reproduce sklearn's routing either way
+    X, y = make_data(nan_share=train_nan_share)
+    model = fit_forest(X, y)
+    engine = compile_forest(model)
+    X_new = make_data(nan_share=0.3, seed=2)[0]
+    assert np.isnan(X_new).any()
+    assert_matches(model, engine, X_new)
+
+
+def test_threaded_chunks_match(monkeypatch):
+    monkeypatch.setattr(forest_engine, "ENGINE_THREADS", 4)
+    X, y = make_data(nan_share=0.1)
+    model = fit_forest(X, y)
+    engine = compile_forest(model)
+    X_new = make_data(n_rows=3000, nan_share=0.1, seed=3)[0]
+    # Several chunks, so the rows go through the thread pool
+    assert X_new.shape[0] * engine.n_trees > 2 * forest_engine.MAX_PAIRS_PER_CHUNK
+    assert_matches(model, engine, X_new)
+    monkeypatch.setattr(forest_engine, "ENGINE_THREADS", 1)
+    np.testing.assert_array_equal(engine.apply(X_new), compile_forest(model).apply(X_new))
+
+
+def test_packed_artifact_matches(tmp_path):
+    X, y = make_data(nan_share=0.1)
+    model = fit_forest(X, y)
+    path = export_forest(model, str(tmp_path / "model.forest"))
+    assert_matches(model, load_forest(path), make_data(nan_share=0.2, seed=4)[0])
+
+
+@pytest.mark.parametrize("nan_share", [0.0, 0.2])
+def test_contributions_sum_to_prediction(nan_share):
+    X, y = make_data(nan_share=nan_share)
+    model = fit_forest(X, y)
+    engine = compile_forest(model)
+    X_new = make_data(n_rows=50, nan_share=nan_share, seed=5)[0]
+    bias, contrib = engine.contributions(X_new)
+    assert contrib.shape == X_new.shape
+    np.testing.assert_allclose(bias + contrib.sum(axis=1), model.predict(X_new), rtol=1e-9, atol=1e-9)
+
+
+def test_rejects_wrong_width():
+    X, y = make_data()
+    engine = ForestEngine(*forest_engine.pack_forest(fit_forest(X, y, n_estimators=3)))
+    with pytest.raises(ValueError):
+        engine.predict(X[:, :3])
@@ -0,0 +1,333 @@
+"""Light and dark theme colors and the CSS injected on every full rerun.
+
+The stylesheet depends only on the theme, so each theme's CSS is
+formatted once per process and reused by every rerun and every session.
+"""
+from functools import lru_cache
+
+THEMES = {
+    "light": {
+        "BG_COLOR": "#f0f2f6",
+        "TEXT_COLOR": "#2c3e50",
+        "SIDEBAR_BG": "#ffffff",
+        "SIDEBAR_TEXT": "#2c3e50",
+        "INPUT_BG": "#ffffff",
+        "INPUT_TEXT": "#2c3e50",
+        "BUTTON_BG": "#2980b9",
+        "BUTTON_HOVER": "#1f6391",
+        "CARD_BG": "#ffffff",
+        "CARD_BORDER": "#3498db",
+        "SHADOW": "0 4px 12px rgba(0, 0, 0, 0.08)",
+        "HISTORY_BG": "#ecf0f1",
+        "LABEL_COLOR": "#2c3e50",
+        "TAB_COLOR": "#2c3e50",
+        "TAB_FONT": "'Montserrat', 'Segoe UI', Arial, sans-serif",
+    },
+    "dark": {
+        "BG_COLOR": "#121212",
+        "TEXT_COLOR": "#e0e0e0",
+        "SIDEBAR_BG": "#1e1e1e",
+        "SIDEBAR_TEXT": "#cccccc",
+        "INPUT_BG": "#2c2c2c",
+        "INPUT_TEXT": "#f0f0f0",
+        "BUTTON_BG": "#1abc9c",
+        "BUTTON_HOVER": "#159b85",
+        "CARD_BG": "#1f2933",
+        "CARD_BORDER": "#1abc9c",
+        "SHADOW": "0 4px 12px rgba(0, 255, 200, 0.3)",
+        "HISTORY_BG": "#2c3e50",
+        "LABEL_COLOR": "#f0f0f0",
+        "TAB_COLOR": "white",
+        "TAB_FONT": "'Montserrat', 'Segoe UI', Arial, sans-serif",
+    },
+}
+
+CSS_TEMPLATE = """
+<style>
+body {{
+    font-family: 'Segoe UI', Arial, sans-serif !important;
+}}
+
+/* Enhanced TAB styling */
+div[data-baseweb="tabs"] > div:first-child {{
+    margin-left: 0 !important;
+    margin-right: 0 !important;
+    width: 100% !important;
+    display: flex !important;
+    justify-content: space-between !important;
+    border-radius: 16px 16px 0 0;
+    box-shadow: 0 2px 6px rgba(0,0,0,0.05);
+    background: {CARD_BG};
+}}
+
+button[data-baseweb="tab"] {{
+    font-family: {TAB_FONT};
+    font-size: 1.19rem;
+    font-weight: 700 !important;
+    color: {TAB_COLOR} !important;
+    background: none !important;
+    flex: 1 1 0px !important;
+    max-width: none !important;
+    padding: 22px 0 18px 0 !important;
+    margin: 0 !important;
+    border-radius: 0 !important;
+    border-bottom: 4px solid transparent !important;
+    transition: background 0.25s, border-bottom 0.25s;
+    justify-content: center !important;
+    align-items: center !important;
+}}
+
+button[data-baseweb="tab"][aria-selected="true"] {{
+    border-bottom: 4px solid {CARD_BORDER} !important;
+    color: {CARD_BORDER} !important;
+    background: rgba(26,188,156,0.08) !important;
+    font-weight: 900 !important;
+    letter-spacing: .4px;
+}}
+
+button[data-baseweb="tab"]:hover {{
+    background: rgba(52,152,219,0.12) !important;
+    color: {CARD_BORDER} !important;
+}}
+
+.tab-content-wrapper {{
+    padding-top: 20px;
+    padding-bottom: 20px;
+}}
+
+#MainMenu {{visibility: hidden;}}
+footer {{visibility: hidden;}}
+html, body {{
+    background-color: {BG_COLOR} !important;
+    color: {TEXT_COLOR} !important;
+}}
+[data-testid="stAppViewContainer"],
+.css-18e3th9,
+.css-1v3fvcr {{
+    background-color: {BG_COLOR} !important;
+    color: {TEXT_COLOR} !important;
+}}
+[data-testid="stSidebar"] > div:first-child {{
+    background-color: {SIDEBAR_BG} !important;
+    color: {SIDEBAR_TEXT} !important;
+}}
+[data-testid="stSidebar"] * {{
+    color: {SIDEBAR_TEXT} !important;
+}}
+[data-testid="stWidgetLabel"] p {{
+    color: {LABEL_COLOR} !important;
+    font-weight: 600 !important;
+}}
+.stNumberInput label, .stSelectbox label {{
+    color: {LABEL_COLOR} !important;
+}}
+.stButton>button {{
+    background-color: {BUTTON_BG} !important;
+    color: white !important;
+    padding: 0.7em 1.8em !important;
+    border-radius: 12px !important;
+    font-weight: 700 !important;
+    font-size: 16px;
+    transition: all 0.3s ease;
+    border: none !important;
+    box-shadow: 0 2px 5px rgba(0,0,0,0.2);
+}}
+.stButton>button:hover {{
+    background-color: {BUTTON_HOVER} !important;
+    transform: translateY(-2px);
+    box-shadow: 0 4px 8px rgba(0,0,0,0.3);
+}}
+.prediction-card {{
+    text-align: center;
+    margin-top: 50px;
+    padding: 32px 40px;
+    background: {CARD_BG};
+    border-radius: 14px;
+    box-shadow: {SHADOW};
+    border-top: 6px solid {CARD_BORDER};
+    transition: all 0.3s ease;
+}}
+.prediction-card:hover {{
+    transform: translateY(-5px);
+    box-shadow: 0 8px 24px rgba(0, 255, 200, 0.4);
+}}
+.prediction-card h2 {{
+    color: {TEXT_COLOR};
+    font-size: 28px;
+}}
+.prediction-card p {{
+    margin: 0;
+    font-size: 40px;
+    font-weight: 900;
+    color: {CARD_BORDER};
+}}
+.history-card {{
+    background: {HISTORY_BG};
+    border-radius: 8px;
+    padding: 12px 16px;
+    margin-bottom: 10px;
+    box-shadow: {SHADOW};
+    transition: all 0.2s ease;
+}}
+.history-card:hover {{
+    transform: scale(1.02);
+}}
+.history-header {{
+    font-weight: 600;
+    margin-bottom: 15px;
+    color: {CARD_BORDER};
+}}
+.custom-footer {{
+    text-align: center;
+    padding: 18px 0;
+    font-size: 14px;
+    color: {SIDEBAR_TEXT};
+    margin-top: 60px;
+    border-top: 1px solid {CARD_BORDER};
+}}
+.input-section {{
+    background: {CARD_BG};
+    padding: 20px;
+    border-radius: 12px;
+    margin-bottom: 20px;
+    box-shadow: {SHADOW};
+}}
+.tooltip {{
+    position: relative;
+    display: inline-block;
+    border-bottom: 1px dotted {CARD_BORDER};
+}}
+.tooltip .tooltiptext {{
+    visibility: hidden;
+    width: 200px;
+    background-color: {CARD_BORDER};
+    color: {TEXT_COLOR};
+    text-align: center;
+    border-radius: 6px;
+    padding: 5px;
+    position: absolute;
+    z-index: 1;
+    bottom: 125%;
+    left: 50%;
+    margin-left: -100px;
+    opacity: 0;
+    transition: opacity 0.3s;
+}}
+.tooltip:hover .tooltiptext {{
+    visibility: visible;
+    opacity: 1;
+}}
+input[type=range] {{
+    -webkit-appearance: none;
+    width: 100%;
+    height: 8px;
+    border-radius: 5px;
+    background: {INPUT_BG};
+    outline: none;
+}}
+input[type=range]::-webkit-slider-thumb {{
+    -webkit-appearance: none;
+    appearance: none;
+    width: 20px;
+    height: 20px;
+    border-radius: 50%;
+    background: {CARD_BORDER};
+    cursor: pointer;
+}}
+.about-feature-container {{
+    display: flex;
+    align-items: flex-start;
+    margin-bottom: 20px;
+    padding: 15px;
+    background: rgba(26, 188, 156, 0.1);
+    border-radius: 8px;
+    border-left: 4px solid {CARD_BORDER};
+}}
+.feature-grid {{
+    display: grid;
+    grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
+    gap: 20px;
+    margin: 20px 0;
+}}
+.feature-card {{
+    background: rgba(26, 188, 156, 0.05);
+    padding: 20px;
+    border-radius: 8px;
+    border: 1px solid rgba(26, 188, 156, 0.2);
+    transition: all 0.3s ease;
+}}
+.feature-card:hover {{
+    transform: translateY(-3px);
+    box-shadow: 0 5px 15px rgba(0,0,0,0.1);
+}}
+.quality-standards {{
+    margin: 20px 0;
+}}
+.standard-row {{
+    display: flex;
+    justify-content: space-between;
+    padding: 12px;
+    margin-bottom: 8px;
+    background: rgba(26, 188, 156, 0.05);
+    border-radius: 6px;
+}}
+.standard-grade {{
+    font-weight: bold;
+    color: {CARD_BORDER};
+}}
+.standard-value {{
+    font-weight: bold;
+}}
+.theme-switch {{
+    position: relative;
+    display: inline-block;
+    width: 60px;
+    height: 34px;
+    margin-top: 10px;
+}}
+.theme-switch input {{
+    opacity: 0;
+    width: 0;
+    height: 0;
+}}
+.slider {{
+    position: absolute;
+    cursor: pointer;
+    top: 0;
+    left: 0;
+    right: 0;
+    bottom: 0;
+    background-color: #ccc;
+    transition: .4s;
+    border-radius: 34px;
+}}
+.slider:before {{
+    position: absolute;
+    content: "🌙";
+    height: 26px;
+    width: 26px;
+    left: 4px;
+    bottom: 4px;
+    background-color: white;
+    transition: .4s;
+    border-radius: 50%;
+    display: flex;
+    align-items: center;
+    justify-content: center;
+    font-size: 14px;
+}}
+input:checked + .slider {{
+    background-color: {CARD_BORDER};
+}}
+input:checked + .slider:before {{
+    content: "☀";
+    transform: translateX(26px);
+}}
+</style>
+"""
+
+
+@lru_cache(maxsize=None)
+def build_css(name):
+    """The full <style> block for a theme, built once per process"""
+    return CSS_TEMPLATE.format(**THEMES[name])
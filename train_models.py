@@ -1,73 +1,384 @@
 import os
+import argparse
+import time
 import pandas as pd
 import numpy as np
 import pickle
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from drift import build_reference, reference_path, save_reference
+from forest_engine import compile_forest, verify_equivalence
+from ingest import load_table
+from model_format import FOREST_SUFFIX, read_forest
+from pipeline import QualityPipeline, export_pipeline, load_packed_pipeline
+from scoring import INPUT_COLS, build_input_matrix, normalize_columns
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder, StandardScaler
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (registers HalvingRandomSearchCV)
 from sklearn.impute import SimpleImputer
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from sklearn.model_selection import HalvingRandomSearchCV, KFold, TimeSeriesSplit, train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
 
 # Setup folders
 base_path = os.path.dirname(os.path.abspath(__file__))
 data_dir = os.path.join(base_path, 'data')
 model_dir = os.path.join(base_path, 'models')
-os.makedirs(model_dir, exist_ok=True)
 
 # Diameter and targets
 diameters = ['10', '12', '16']
 targets = ['QUALITY1', 'QUALITY2']
 
-for d in diameters:
+# Search spaces for --tune; successive halving drops weak configs on small samples first
+RF_SEARCH_SPACE = {
+    'randomforestregressor__n_estimators': [25, 50, 100, 200, 300],
+    'randomforestregressor__max_depth': [None, 8, 12, 16, 24],
+    'randomforestregressor__min_samples_leaf': [1, 2, 4, 8],
+    'randomforestregressor__max_features': [1.0, 0.6, 0.33, 'sqrt'],
+}
+XGB_SEARCH_SPACE = {
+    'xgbregressor__n_estimators': [100, 200, 400],
+    'xgbregressor__max_depth': [3, 4, 6, 8],
+    'xgbregressor__learning_rate': [0.03, 0.05, 0.1],
+    'xgbregressor__subsample': [0.7, 0.85, 1.0],
+    'xgbregressor__colsample_bytree': [0.6, 0.8, 1.0],
+}
+
+
+def load_diameter_frame(d):
+    """Read Diameter_{d}.xlsx with canonical column names; None if missing"""
     file_path = os.path.join(data_dir, f'Diameter_{d}.xlsx')
     if not os.path.exists(file_path):
         print(f"⚠️ Missing file: {file_path}")
-        continue
+        return None
 
     print(f"📄 Reading data from Diameter_{d}.xlsx...")
-    df = pd.read_excel(file_path)
+    # Parsed once into data/.cache and re-read from there until the workbook changes
+    df = normalize_columns(load_table(file_path))
 
-    # DateTime feature engineering
     if 'DATE_TIME' in df.columns:
         df['DATE_TIME'] = pd.to_datetime(df['DATE_TIME'], errors='coerce')
-        df['HOUR'] = df['DATE_TIME'].dt.hour
+    return df
 
-    # Encode categorical GRADE
-    if 'GRADE' in df.columns:
-        df['GRADE'] = LabelEncoder().fit_transform(df['GRADE'].astype(str))
 
-    # One-hot encode other categorical variables if needed
-    df = pd.get_dummies(df)
+def compute_watermark(df):
+    """Newest DATE_TIME trained on (plus the IDs at that instant) and the row count"""
+    watermark = {"date_time": None, "ids": [], "rows": int(len(df))}
+    if 'DATE_TIME' in df.columns and df['DATE_TIME'].notna().any():
+        latest = df['DATE_TIME'].max()
+        watermark["date_time"] = latest.isoformat()
+        if 'ID' in df.columns:
+            watermark["ids"] = sorted(df.loc[df['DATE_TIME'] == latest, 'ID'].astype(str))
+    return watermark
+
+
+def rows_since(df, watermark):
+    """Rows appended after the watermark (falls back to row position without DATE_TIME)"""
+    if watermark.get("date_time") and 'DATE_TIME' in df.columns:
+        latest = pd.Timestamp(watermark["date_time"])
+        newer = df['DATE_TIME'] > latest
+        if 'ID' in df.columns:
+            newer |= (df['DATE_TIME'] == latest) & ~df['ID'].astype(str).isin(watermark.get("ids", []))
+        return df[newer]
+    return df.iloc[watermark.get("rows", 0):]
+
+
+def save_pipeline(pipeline, d, target, X_check, out_dir=model_dir):
+    """Pickle the pipeline, export the packed forest and record the watermark"""
+    key = f"{target.lower()}_d{d}"
+    model_filename = f"{key}.pkl"
+    model_path = os.path.join(out_dir, model_filename)
+
+    # Write then rename, so the app's model watcher never reads a half-written pickle
+    with open(model_path + '.tmp', 'wb') as f:
+        pickle.dump(pipeline, f)
+    os.replace(model_path + '.tmp', model_path)
+
+    # Packed, memory-mappable copy used for serving; must match sklearn exactly
+    forest_path = export_pipeline(pipeline, os.path.join(out_dir, f"{key}{FOREST_SUFFIX}"))
+    max_diff = verify_equivalence(pipeline, load_packed_pipeline(forest_path), X_check)
+    print(f"🔎 Packed forest matches sklearn on {len(X_check)} rows (max diff {max_diff:.2e})")
+
+    with open(os.path.join(out_dir, f"{key}.watermark.json"), 'w') as f:
+        json.dump(pipeline.watermark, f, indent=2)
+
+    print(f"✅ Saved model: {os.path.relpath(model_path, base_path)}")
 
-    for target in targets:
-        if target not in df.columns:
-            print(f"⚠️ Skipping {target} for diameter {d} (not in data)")
-            continue
 
-        print(f"🔧 Training model for {target} on diameter {d}...")
+def test_metrics(y_true, y_pred):
+    """Held-out error of a fitted model"""
+    return {
+        "mae": float(mean_absolute_error(y_true, y_pred)),
+        "rmse": float(np.sqrt(mean_squared_error(y_true, y_pred))),
+        "r2": float(r2_score(y_true, y_pred)),
+    }
 
-        # Prepare data
-        temp_df = df.dropna(subset=[target])
-        y = temp_df[target]
-        X = temp_df.drop(columns=['ID', 'DATE_TIME', 'QUALITY1', 'QUALITY2'], errors='ignore')
 
-        # Clean missing values
-        X = pd.DataFrame(SimpleImputer(strategy='median').fit_transform(X), columns=X.columns)
-        X = pd.DataFrame(StandardScaler().fit_transform(X), columns=X.columns)
+def latency_ms(model, X, repeats=200):
+    """Median 1-row predict latency in milliseconds"""
+    rows = X[np.arange(repeats) % len(X)]
+    samples = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        model.predict(rows[i:i + 1])
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples) * 1000)
 
-        # Train/test split
+
+def train_model(d, target, df, n_jobs=1, out_dir=model_dir):
+    """Fit, save and verify one (diameter, target) pipeline; returns wall time"""
+    start = time.perf_counter()
+    print(f"🔧 Training model for {target} on diameter {d} (n_jobs={n_jobs})...")
+
+    # Prepare data: the same FEATURE_COLS matrix the app and server build
+    temp_df = df.dropna(subset=[target])
+    y = temp_df[target].to_numpy()
+    X = build_input_matrix(temp_df)
+
+    # Train/test split
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    # Fit imputer, scaler and forest together so serving reuses the same statistics
+    model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=n_jobs)
+    pipeline = QualityPipeline.fit(X_train, y_train, model, target=target, diameter=int(d))
+    # Serving runs single-threaded; don't persist the training thread budget
+    model.set_params(n_jobs=None)
+    pipeline.watermark = compute_watermark(df)
+    scores = test_metrics(y_test, pipeline.predict(X_test))
+    print(f"📏 {target} d{d} test MAE {scores['mae']:.2f} • RMSE {scores['rmse']:.2f} • R² {scores['r2']:.3f}")
+
+    save_pipeline(pipeline, d, target, X_test, out_dir)
+    return time.perf_counter() - start
+
+
+def tune_model(d, target, df, n_jobs=1, cv='kfold', folds=5, candidates=40,
+               max_latency_ms=None, top_k=5, with_xgboost=True, out_dir=model_dir):
+    """Successive-halving search over forest settings; saves the chosen forest.
+
+    The search runs an sklearn imputer -> scaler -> model chain equivalent
+    to QualityPipeline. The top_k forests by CV error are refit, compiled
+    for the serving engine and timed. The most accurate one within
+    max_latency_ms (or overall) is saved. XGBoost is searched for
+    comparison only: serving needs the forest's trees.
+    """
+    start = time.perf_counter()
+    print(f"🔍 Tuning {target} on diameter {d} ({cv} CV, {folds} folds, {candidates} candidates)...")
+    temp_df = df.dropna(subset=[target])
+    if cv == 'time':
+        # Time-ordered folds and the newest 20% held out, as the model is used on future heats
+        temp_df = temp_df.sort_values('DATE_TIME', kind='stable')
+        X, y = build_input_matrix(temp_df), temp_df[target].to_numpy()
+        n_test = len(X) // 5
+        X_train, X_test, y_train, y_test = X[:-n_test], X[-n_test:], y[:-n_test], y[-n_test:]
+        splitter = TimeSeriesSplit(n_splits=folds)
+    else:
+        X, y = build_input_matrix(temp_df), temp_df[target].to_numpy()
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        splitter = KFold(n_splits=folds, shuffle=True, random_state=42)
+
+    def search(estimator, space):
+        chain = make_pipeline(SimpleImputer(strategy="median", keep_empty_features=True), StandardScaler(), estimator)
+        result = HalvingRandomSearchCV(
+            chain, space, n_candidates=candidates, factor=3, cv=splitter,
+            scoring='neg_mean_absolute_error', n_jobs=n_jobs, random_state=42,
+        )
+        return result.fit(X_train, y_train)
+
+    rf_search = search(RandomForestRegressor(random_state=42, n_jobs=1), RF_SEARCH_SPACE)
+    results = pd.DataFrame(rf_search.cv_results_)
+    # Only configs that survived to the last (full-data) round are comparable
+    final = results[results['iter'] == results['iter'].max()].sort_values('rank_test_score').head(top_k)
+
+    report = {"diameter": int(d), "target": target, "cv": cv, "folds": folds, "forests": []}
+    best = None
+    for _, row in final.iterrows():
+        params = {k.split('__', 1)[1]: v for k, v in row['params'].items()}
+        model = RandomForestRegressor(random_state=42, n_jobs=n_jobs, **params)
+        pipeline = QualityPipeline.fit(X_train, y_train, model, target=target, diameter=int(d))
+        model.set_params(n_jobs=None)
+        served = pipeline.with_model(compile_forest(model))
+        entry = {
+            "params": {k: (None if v is None or (isinstance(v, float) and np.isnan(v)) else v) for k, v in params.items()},
+            "cv_mae": float(-row['mean_test_score']),
+            "test": test_metrics(y_test, served.predict(X_test)),
+            "latency_ms": latency_ms(served, X_test),
+            "n_nodes": int(served.model.meta['n_nodes']),
+        }
+        report["forests"].append(entry)
+        print(f"   🌲 {entry['params']} → CV MAE {entry['cv_mae']:.2f} • test MAE {entry['test']['mae']:.2f} • "
+              f"{entry['latency_ms']:.3f} ms/row • {entry['n_nodes']:,} nodes")
+        within_budget = max_latency_ms is None or entry['latency_ms'] <= max_latency_ms
+        if within_budget and (best is None or entry['cv_mae'] < best[0]['cv_mae']):
+            best = (entry, pipeline)
+
+    if with_xgboost:
+        try:
+            from xgboost import XGBRegressor
+        except ImportError:
+            print("⚠️ xgboost not installed; skipping the XGBoost comparison")
+        else:
+            xgb_search = search(XGBRegressor(random_state=42, n_jobs=1, tree_method='hist'), XGB_SEARCH_SPACE)
+            xgb_best = xgb_search.best_estimator_
+            report["xgboost"] = {
+                "params": {k.split('__', 1)[1]: v for k, v in xgb_search.best_params_.items()},
+                "cv_mae": float(-xgb_search.best_score_),
+                "test": test_metrics(y_test, xgb_best.predict(X_test)),
+                "latency_ms": latency_ms(xgb_best, X_test),
+            }
+            print(f"   ⚡ XGBoost {report['xgboost']['params']} → CV MAE {report['xgboost']['cv_mae']:.2f} • "
+                  f"test MAE {report['xgboost']['test']['mae']:.2f} • {report['xgboost']['latency_ms']:.3f} ms/row "
+                  "(reported only)")
+
+    if best is None:
+        print(f"⚠️ No forest for {target} d{d} met {max_latency_ms} ms/row; keeping the current model")
+    else:
+        entry, pipeline = best
+        report["selected"] = entry
+        pipeline.watermark = compute_watermark(df)
+        print(f"🏆 {target} d{d}: {entry['params']} (test MAE {entry['test']['mae']:.2f}, {entry['latency_ms']:.3f} ms/row)")
+        save_pipeline(pipeline, d, target, X_test, out_dir)
+
+    with open(os.path.join(out_dir, f"{target.lower()}_d{d}.tuning.json"), 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    return time.perf_counter() - start
+
+
+def update_model(d, target, df, n_jobs=1, add_trees=20, min_new_rows=100, out_dir=model_dir):
+    """Grow the production forest with trees fit on rows newer than its watermark"""
+    start = time.perf_counter()
+    model_path = os.path.join(model_dir, f"{target.lower()}_d{d}.pkl")
+    pipeline = None
+    if os.path.exists(model_path):
+        with open(model_path, 'rb') as f:
+            pipeline = pickle.load(f)
+    if not isinstance(pipeline, QualityPipeline) or getattr(pipeline, "watermark", None) is None:
+        print(f"⚠️ No incremental state for {target} d{d}; running a full retrain")
+        return train_model(d, target, df, n_jobs, out_dir)
+
+    forest_path = os.path.join(model_dir, f"{target.lower()}_d{d}{FOREST_SUFFIX}")
+    if os.path.isdir(forest_path) and "compression" in read_forest(forest_path)[1]:
+        # Growing the pickled full forest would re-export it and silently undo the compression
+        print(f"⚠️ {target} d{d} serves a compressed variant; retrain it in full, then rerun compress_models.py")
+        return time.perf_counter() - start
+
+    new_df = rows_since(df, pipeline.watermark).dropna(subset=[target])
+    if len(new_df) < min_new_rows:
+        print(f"⏭ {target} d{d} up to date ({len(new_df)} new rows < {min_new_rows})")
+        return time.perf_counter() - start
+
+    model = pipeline.model
+    n_before = len(model.estimators_)
+    print(f"🌱 Adding {add_trees} trees to {target} d{d} from {len(new_df)} new rows...")
+    X_new = build_input_matrix(new_df)
+    # Existing preprocessing is kept so old and new trees see the same feature scale
+    model.set_params(warm_start=True, n_estimators=n_before + add_trees, n_jobs=n_jobs)
+    model.fit(pipeline.transform(X_new), new_df[target].to_numpy())
+    model.set_params(warm_start=False, n_jobs=None)
+    pipeline.feature_importances = model.feature_importances_
+    pipeline.watermark = compute_watermark(df)
+    # Bootstrap masks of a warm-started forest no longer match its training rows (see compress_models.py)
+    pipeline.watermark["incremental"] = True
+
+    save_pipeline(pipeline, d, target, X_new, out_dir)
+    return time.perf_counter() - start
+
+
+def plan_workers(n_jobs_total, workers=None, cpus=None):
+    """Split the core budget between concurrent jobs and each forest's n_jobs"""
+    cpus = cpus or os.cpu_count() or 1
+    workers = max(1, min(workers or cpus, n_jobs_total, cpus))
+    return workers, max(1, cpus // workers)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the rebar quality models")
+    parser.add_argument("--diameters", nargs="+", default=diameters,
+                        help="Diameters to rebuild (default: all)")
+    parser.add_argument("--targets", nargs="+", default=targets, type=str.upper,
+                        help="Targets to rebuild (default: all)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Concurrent training jobs (default: one per core, capped by job count)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Grow existing forests from rows newer than their saved watermark")
+    parser.add_argument("--add-trees", type=int, default=20,
+                        help="Trees added per incremental update (default: 20)")
+    parser.add_argument("--min-new-rows", type=int, default=100,
+                        help="Skip incremental updates with fewer new rows (default: 100)")
+    parser.add_argument("--tune", action="store_true",
+                        help="Successive-halving hyperparameter search before saving each model")
+    parser.add_argument("--cv", choices=["kfold", "time"], default="kfold",
+                        help="Tuning folds: shuffled K-fold or time-ordered splits (default: kfold)")
+    parser.add_argument("--folds", type=int, default=5, help="Tuning CV folds (default: 5)")
+    parser.add_argument("--candidates", type=int, default=40,
+                        help="Random configs in the first halving round (default: 40)")
+    parser.add_argument("--max-latency-ms", type=float, default=None,
+                        help="Only save tuned forests at or below this 1-row latency")
+    parser.add_argument("--no-xgboost", action="store_true", help="Skip the XGBoost comparison when tuning")
+    parser.add_argument("--shadow", action="store_true",
+                        help="Save to models/shadow/ as candidates scored next to production (see shadow.py)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    out_dir = os.path.join(model_dir, 'shadow') if args.shadow else model_dir
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Build the (diameter, target) job grid
+    jobs = []
+    frames = {}
+    for d in args.diameters:
+        df = load_diameter_frame(d)
+        if df is None:
+            continue
+        frames[d] = df
+        for target in args.targets:
+            if target not in df.columns:
+                print(f"⚠️ Skipping {target} for diameter {d} (not in data)")
+                continue
+            jobs.append((d, target))
+
+    if not jobs:
+        print("❌ Nothing to train")
+        return
+
+    if args.tune:
+        job_fn = partial(tune_model, cv=args.cv, folds=args.folds, candidates=args.candidates,
+                         max_latency_ms=args.max_latency_ms, with_xgboost=not args.no_xgboost, out_dir=out_dir)
+    elif args.incremental:
+        job_fn = partial(update_model, add_trees=args.add_trees, min_new_rows=args.min_new_rows, out_dir=out_dir)
+    else:
+        job_fn = partial(train_model, out_dir=out_dir)
 
-        # Train model
-        model = RandomForestRegressor(n_estimators=100, random_state=42)
-        model.fit(X_train, y_train)
+    workers, n_jobs = plan_workers(len(jobs), args.workers)
+    print(f"🚀 Training {len(jobs)} models with {workers} worker(s) x {n_jobs} thread(s)")
+    start = time.perf_counter()
+    if workers == 1:
+        for d, target in jobs:
+            job_fn(d, target, frames[d], n_jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(job_fn, d, target, frames[d], n_jobs): (d, target)
+                for d, target in jobs
+            }
+            for future in as_completed(futures):
+                d, target = futures[future]
+                print(f"⏱ {target} d{d} finished in {future.result():.1f}s")
 
-        # Save model
-        model_filename = f"{target.lower()}_d{d}.pkl"
-        model_path = os.path.join(model_dir, model_filename)
+    if args.shadow:
+        # Candidates see production traffic, so they keep production's drift references
+        print(f"🧪 Candidates saved to {out_dir}; promote with: python shadow.py promote <key>")
+    else:
+        # Input-drift references the serving side compares live traffic against
+        for d, df in frames.items():
+            reference = build_reference(build_input_matrix(df, INPUT_COLS), d)
+            save_reference(reference, reference_path(model_dir, d))
+        print(f"📐 Saved drift references for diameter(s) {', '.join(frames)}")
 
-        with open(model_path, 'wb') as f:
-            pickle.dump(model, f)
+    print(f"🎉 All models trained and saved in {time.perf_counter() - start:.1f}s!")
 
-        print(f"✅ Saved model: {model_filename}")
 
-print("🎉 All models trained and saved!")
+if __name__ == "__main__":
+    main()